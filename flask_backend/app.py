@@ -1,20 +1,175 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import and_, func, literal_column, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from itsdangerous import BadSignature, URLSafeSerializer
 from flask_cors import CORS
-from werkzeug.security import generate_password_hash, check_password_hash
+from collections import Counter, namedtuple
 from datetime import datetime
+from itertools import islice
+from operator import attrgetter
+import atexit
+import math
 import os
+import threading
+import time
+
+from db_profile import engine_options, install_pragmas, sqlite_profile
+from db_routing import ReplicaRouter, RoutingSession, database_urls
+from json_provider import json_provider_class
+from http_cache import (VersionTable, is_not_modified, leaderboard_key, leaderboard_keys_for_score,
+                        not_modified, set_cache_headers)
+from leaderboard_engine import LeaderboardEngine
+from leaderboard_windows import WINDOWS, oldest_retained, period_key, period_keys
+from password_hasher import HasherBusy, PasswordHasher
+from replay_check import ReplayError, ReplayVerifier, VerifierBusy, parse_replay, replay_check_mode
+from request_metrics import RequestMetrics
+from response_compression import ResponseCompressor
+from score_export import EXPORT_FORMATS, export_lines
+from score_shards import ScoreShards
+from session_tokens import MemoryRevocations, SessionTokens, TableRevocations, TokenError
+from write_queue import QueueFull, WriteBehindQueue
 
 app = Flask(__name__)
-CORS(app, resources={r"/api/*": {"origins": ["*"], "methods": ["GET", "POST", "PUT", "DELETE"], "allow_headers": ["Content-Type"]}})  # 配置跨域请求，允许所有来源
+# 配置跨域请求，允许所有来源；浏览器客户端需要发送令牌（Authorization）和条件请求头（If-None-Match），并读取 ETag
+CORS(app, resources={r"/api/*": {
+    "origins": ["*"],
+    "methods": ["GET", "POST", "PUT", "DELETE"],
+    "allow_headers": ["Content-Type", "Authorization", "If-None-Match"],
+    "expose_headers": ["ETag"]
+}})
 
 # 数据库配置
 basedir = os.path.abspath(os.path.dirname(__file__))
-app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(basedir, "game_data.db")}'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', f'sqlite:///{os.path.join(basedir, "game_data.db")}')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SECRET_KEY'] = 'your-secret-key-here'
+# SQLite 引擎配置（WAL、PRAGMA、连接池），由 SQLITE_PROFILE 选择，见 db_profile.py
+app.config['SQLITE_PRAGMAS'], _sqlite_pool = sqlite_profile()
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'], _sqlite_pool)
+# 只读副本（db_routing.py）和成绩分片（score_shards.py）：逗号分隔的 SQLite 文件路径或连接串。
+# 分片数确定后不能再修改，否则已有成绩会落在错误的分片上
+app.config['READ_REPLICAS'] = database_urls(os.environ.get('READ_REPLICAS', ''))
+app.config['SCORE_SHARDS'] = database_urls(os.environ.get('SCORE_SHARDS', ''))
+app.config['SQLALCHEMY_BINDS'] = {
+    **{f'replica_{i}': url for i, url in enumerate(app.config['READ_REPLICAS'])},
+    **{f'shard_{i}': url for i, url in enumerate(app.config['SCORE_SHARDS'])},
+}
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key-here')
+# jsonify 使用的 JSON 后端：auto（有 orjson 时使用 orjson）、orjson、stdlib，见 json_provider.py
+app.config['JSON_BACKEND'] = os.environ.get('JSON_BACKEND', 'auto')
+app.json = json_provider_class(app.config['JSON_BACKEND'])(app)
+# 会话令牌有效期（秒）；AUTH_REQUIRED 开启后成绩上传和个人成绩查询必须携带令牌
+app.config['SESSION_TOKEN_MAX_AGE'] = int(os.environ.get('SESSION_TOKEN_MAX_AGE', 7 * 24 * 3600))
+app.config['AUTH_REQUIRED'] = os.environ.get('AUTH_REQUIRED', '0') == '1'
+# 令牌注销记录的保存位置：database（revoked_token 表，多进程共享）或 memory（进程内，仅适用于单进程部署）
+app.config['TOKEN_REVOCATION'] = os.environ.get('TOKEN_REVOCATION', 'database')
+# 内存排行榜：启动时从数据库加载，读请求不再访问数据库（多进程部署时应关闭）。
+# 配置了只读副本时默认关闭：内存排行榜跟随主库，开启后排行榜读请求不会发往副本
+app.config['LEADERBOARD_CACHE'] = os.environ.get('LEADERBOARD_CACHE', '0' if app.config['READ_REPLICAS'] else '1') == '1'
+# 密码哈希进程池：进程数（0 表示在请求线程中直接计算）、最多同时等待的请求数（超出返回 429）
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 1))
+app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 0)) or None
+# 新哈希使用的参数；开启 PASSWORD_REHASH_ON_LOGIN 后，登录成功时把旧参数的哈希升级为该参数
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:260000')
+app.config['PASSWORD_REHASH_ON_LOGIN'] = os.environ.get('PASSWORD_REHASH_ON_LOGIN', '0') == '1'
+# 限时排行榜（日 / 周 / 赛季）：每个周期每个桶保留的前 K 名，以及各周期保留的个数（更早的周期榜被清除）
+app.config['WINDOW_TOP_K'] = int(os.environ.get('WINDOW_TOP_K', 100))
+app.config['WINDOW_RETENTION'] = {
+    window: int(os.environ.get(f'WINDOW_RETENTION_{window.upper()}', default))
+    for window, default in (('day', 30), ('week', 12), ('season', 4))
+}
+# 批量上传接口单次最多接受的成绩条数
+app.config['SCORE_BATCH_MAX'] = int(os.environ.get('SCORE_BATCH_MAX', 500))
+# 成绩导出时每批从数据库取回的行数
+app.config['EXPORT_YIELD_PER'] = int(os.environ.get('EXPORT_YIELD_PER', 1000))
+# 成绩回放校验模式（off / optional / required / auto），见 replay_check.replay_check_mode
+app.config['REPLAY_CHECK'] = replay_check_mode(os.environ.get('REPLAY_CHECK', 'auto'))
+app.config['REPLAY_WORKERS'] = int(os.environ.get('REPLAY_WORKERS', os.cpu_count() or 1))
+app.config['REPLAY_BATCH_SIZE'] = int(os.environ.get('REPLAY_BATCH_SIZE', 64))
+app.config['REPLAY_BATCH_WINDOW'] = float(os.environ.get('REPLAY_BATCH_WINDOW', 0.005))
+# JSON 响应压缩：按 Accept-Encoding 协商 br（需安装 brotli）或 gzip，只压缩超过阈值的响应
+app.config['COMPRESS'] = os.environ.get('COMPRESS', '1') == '1'
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+app.config['COMPRESS_GZIP_LEVEL'] = int(os.environ.get('COMPRESS_GZIP_LEVEL', 6))
+app.config['COMPRESS_BROTLI_QUALITY'] = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+# /api/stats 快照的有效期（秒）
+app.config['STATS_CACHE_TTL'] = float(os.environ.get('STATS_CACHE_TTL', 5))
+# 读接口的 ETag / Cache-Control；max-age 为 0 时客户端每次重新验证，数据未变化时返回 304。
+# 配置了只读副本时默认关闭：版本号跟随主库，副本上落后的数据会以新的 ETag 被缓存
+app.config['HTTP_CACHE'] = os.environ.get('HTTP_CACHE', '0' if app.config['READ_REPLICAS'] else '1') == '1'
+app.config['HTTP_CACHE_MAX_AGE'] = int(os.environ.get('HTTP_CACHE_MAX_AGE', 0))
+# 请求计时与 SQL 统计（/api/metrics），超过阈值（毫秒）的请求和查询写入日志
+app.config['METRICS'] = os.environ.get('METRICS', '1') == '1'
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 500))
+app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 100))
+# 异步写入（write-behind）：成绩先进入有界内存队列，由后台线程分组提交，上传接口返回 202
+app.config['SCORE_WRITE_BEHIND'] = os.environ.get('SCORE_WRITE_BEHIND', '0') == '1'
+app.config['SCORE_QUEUE_MAXSIZE'] = int(os.environ.get('SCORE_QUEUE_MAXSIZE', 10000))
+app.config['SCORE_QUEUE_BATCH_SIZE'] = int(os.environ.get('SCORE_QUEUE_BATCH_SIZE', 200))
+app.config['SCORE_QUEUE_FLUSH_INTERVAL'] = float(os.environ.get('SCORE_QUEUE_FLUSH_INTERVAL', 0.05))
+app.config['SCORE_QUEUE_DURABILITY'] = os.environ.get('SCORE_QUEUE_DURABILITY', 'flush')  # none / flush / fsync
+app.config['SCORE_QUEUE_JOURNAL'] = os.environ.get('SCORE_QUEUE_JOURNAL', os.path.join(basedir, 'score_queue.journal'))
+
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
+replica_router = ReplicaRouter(f'replica_{i}' for i in range(len(app.config['READ_REPLICAS'])))
+
+password_hasher = PasswordHasher(
+    workers=app.config['PASSWORD_HASH_WORKERS'],
+    max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+    method=app.config['PASSWORD_HASH_METHOD']
+)
+atexit.register(password_hasher.shutdown)
+
+replay_verifier = None
+if app.config['REPLAY_CHECK'] != 'off':
+    replay_verifier = ReplayVerifier(
+        workers=app.config['REPLAY_WORKERS'],
+        batch_size=app.config['REPLAY_BATCH_SIZE'],
+        batch_window=app.config['REPLAY_BATCH_WINDOW']
+    )
+    atexit.register(replay_verifier.shutdown)
 
-db = SQLAlchemy(app)
+# 分页游标：对最后一行的排序键签名编码，客户端只能原样传回。
+# 每种游标使用单独的 salt，一个接口签发的游标不能用在另一个接口上；解码后再按字段类型校验
+CURSOR_FIELDS = {
+    'leaderboard': (int, int, (int, float), int),  # (名次, score, completion_time, id)
+    'history': (str, int),  # (created_at, id)
+}
+cursor_serializers = {
+    kind: URLSafeSerializer(app.config['SECRET_KEY'], salt=f'page-cursor:{kind}') for kind in CURSOR_FIELDS
+}
+
+def encode_cursor(kind, *values):
+    return cursor_serializers[kind].dumps(values)
+
+def decode_cursor(kind, cursor):
+    try:
+        values = cursor_serializers[kind].loads(cursor)
+    except BadSignature:
+        raise ValueError('无效的分页游标')
+    fields = CURSOR_FIELDS[kind]
+    if not isinstance(values, list) or len(values) != len(fields) or not all(
+        isinstance(value, types) and not isinstance(value, bool) for value, types in zip(values, fields)
+    ):
+        raise ValueError('无效的分页游标')
+    return values
+
+request_metrics = RequestMetrics(app.config['SLOW_REQUEST_MS'], app.config['SLOW_QUERY_MS'])
+
+with app.app_context():
+    for _engine in db.engines.values():
+        install_pragmas(_engine, app.config['SQLITE_PRAGMAS'])
+    if app.config['METRICS']:
+        request_metrics.install(app, db.engines.values())
+
+# 在计时钩子之后注册：after_request 倒序执行，压缩耗时计入请求耗时
+response_compressor = ResponseCompressor(
+    min_size=app.config['COMPRESS_MIN_SIZE'],
+    gzip_level=app.config['COMPRESS_GZIP_LEVEL'],
+    brotli_quality=app.config['COMPRESS_BROTLI_QUALITY']
+)
+if app.config['COMPRESS']:
+    response_compressor.install(app)
 
 # 用户模型
 class User(db.Model):
@@ -28,10 +183,10 @@ class User(db.Model):
     scores = db.relationship('Score', backref='user', lazy=True, cascade='all, delete-orphan')
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
     
     def to_dict(self):
         return {
@@ -65,6 +220,714 @@ class Score(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+# 个人最佳成绩（反范式表）：每个玩家在每个 (level_type, level_number, difficulty) 桶中的最好成绩，
+# 由 upload_score 在同一事务内维护，用于 distinct_users 排行榜
+class PersonalBest(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    level_type = db.Column(db.String(50), nullable=False)
+    level_number = db.Column(db.Integer, nullable=True)
+    difficulty = db.Column(db.String(20), nullable=True)
+    score_id = db.Column(db.Integer, db.ForeignKey('score.id'), nullable=False)  # 对应的成绩记录
+    score = db.Column(db.Integer, nullable=False)
+    completion_time = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime)  # 该成绩的上传时间
+
+# 每个玩家每个桶只有一条记录；level_number/difficulty 可为空，用 coalesce 使 NULL 参与唯一约束
+db.Index(
+    'uq_personal_best_bucket',
+    PersonalBest.user_id,
+    PersonalBest.level_type,
+    func.coalesce(PersonalBest.level_number, -1),
+    func.coalesce(PersonalBest.difficulty, ''),
+    unique=True
+)
+db.Index(
+    'ix_personal_best_rank',
+    PersonalBest.level_type,
+    PersonalBest.level_number,
+    PersonalBest.difficulty,
+    PersonalBest.score.desc(),
+    PersonalBest.completion_time.asc()
+)
+
+# 限时排行榜汇总表：每个周期 (period_type, period_key) 每个桶中的前 WINDOW_TOP_K 名成绩，
+# 由 save_scores 在同一事务内维护，查询“本周前 100 名”只需读取几百行而不必按 created_at 扫描历史成绩
+class PeriodTop(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    period_type = db.Column(db.String(10), nullable=False)  # 'day'、'week'、'season'
+    period_key = db.Column(db.String(10), nullable=False)  # 见 leaderboard_windows.period_key
+    level_type = db.Column(db.String(50), nullable=False)
+    level_number = db.Column(db.Integer, nullable=True)
+    difficulty = db.Column(db.String(20), nullable=True)
+    score_id = db.Column(db.Integer, db.ForeignKey('score.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    score = db.Column(db.Integer, nullable=False)
+    completion_time = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime)
+
+db.Index(
+    'ix_period_top_rank',
+    PeriodTop.period_type,
+    PeriodTop.period_key,
+    PeriodTop.level_type,
+    PeriodTop.level_number,
+    PeriodTop.difficulty,
+    PeriodTop.score.desc(),
+    PeriodTop.completion_time.asc()
+)
+
+# 已注销的会话令牌，保留到令牌自然过期
+class RevokedToken(db.Model):
+    sid = db.Column(db.String(32), primary_key=True)
+    expires_at = db.Column(db.Float, nullable=False, index=True)  # Unix 时间戳
+
+session_tokens = SessionTokens(
+    app.config['SECRET_KEY'],
+    app.config['SESSION_TOKEN_MAX_AGE'],
+    TableRevocations(RevokedToken.__table__, lambda: db.engine) if app.config['TOKEN_REVOCATION'] == 'database' else MemoryRevocations()
+)
+
+# 统计计数器：register 和 save_scores 在写入的同一事务内增量更新，/api/stats 不再做 COUNT 全表扫描
+class StatCounter(db.Model):
+    name = db.Column(db.String(80), primary_key=True)  # 'total_users'、'total_scores'、'scores:<level_type>'
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+# 已归档成绩数的计数器前缀，见 reconcile_stat_counters
+ARCHIVED_COUNTER_PREFIX = 'archived:'
+
+def increment_counters(deltas, conn=None):
+    """在当前事务内累加计数器，不存在时创建；conn 为 None 时使用 db.session 的事务"""
+    table = StatCounter.__table__
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c.name], set_={'value': table.c.value + stmt.excluded.value})
+    (conn or db.session).execute(stmt, [{'name': name, 'value': value} for name, value in deltas.items()])
+
+def reconcile_stat_counters():
+    """用真实 COUNT 结果重写计数器，返回修正前后不一致的项 {name: (旧值, 新值)}。
+    归档任务把移出热表的成绩数记在 archived:<计数器名> 中，成绩计数为热表 COUNT 加上已归档的条数
+    """
+    level_counts = score_level_counts()
+    actual = {
+        'total_users': User.query.count(),
+        'total_scores': sum(level_counts.values()),
+    }
+    for level_type, count in level_counts.items():
+        actual[f'scores:{level_type}'] = count
+    
+    stored = dict(db.session.query(StatCounter.name, StatCounter.value))
+    for name, value in stored.items():
+        if name.startswith(ARCHIVED_COUNTER_PREFIX):
+            actual[name] = value
+            counted = name[len(ARCHIVED_COUNTER_PREFIX):]
+            actual[counted] = actual.get(counted, 0) + value
+    for name in stored:
+        actual.setdefault(name, 0)
+    
+    StatCounter.query.delete()
+    db.session.add_all([StatCounter(name=name, value=value) for name, value in actual.items()])
+    db.session.commit()
+    invalidate_stats_cache()
+    
+    return {name: (stored.get(name), value) for name, value in actual.items() if stored.get(name) != value}
+
+# 排行榜复合索引：每种过滤组合对应一个 (过滤列..., score DESC, completion_time ASC) 索引，
+# 查询可直接按索引顺序读取前 limit 行，无需全表扫描和临时排序
+LEADERBOARD_INDEXES = {
+    (): 'ix_score_rank',
+    ('level_type',): 'ix_score_type_rank',
+    ('level_type', 'level_number'): 'ix_score_type_level_rank',
+    ('level_type', 'difficulty'): 'ix_score_type_difficulty_rank',
+    ('level_type', 'level_number', 'difficulty'): 'ix_score_type_level_difficulty_rank',
+    ('level_number',): 'ix_score_level_rank',
+    ('difficulty',): 'ix_score_difficulty_rank',
+    ('level_number', 'difficulty'): 'ix_score_level_difficulty_rank',
+}
+
+for _filters, _index_name in LEADERBOARD_INDEXES.items():
+    db.Index(
+        _index_name,
+        *[getattr(Score, column) for column in _filters],
+        Score.score.desc(),
+        Score.completion_time.asc()
+    )
+
+# 用于查找玩家在某个排行榜中的最佳成绩
+db.Index('ix_score_user_rank', Score.user_id, Score.score.desc(), Score.completion_time.asc())
+# 个人成绩历史按上传时间倒序分页
+db.Index('ix_score_user_history', Score.user_id, Score.created_at)
+
+# 成绩分片：配置了 SCORE_SHARDS 时成绩行只写入分片（带上面的全部索引），主库的 score 表保持为空
+score_shards = None
+if app.config['SCORE_SHARDS']:
+    with app.app_context():
+        score_shards = ScoreShards(Score.__table__, [db.engines[f'shard_{i}'] for i in range(len(app.config['SCORE_SHARDS']))])
+    atexit.register(score_shards.shutdown)
+
+# 成绩序列化所需的列（含用户名），通过一条 JOIN 查询以元组形式取回，
+# 避免 Score.to_dict() 逐行懒加载 user 造成的 N+1 查询
+SCORE_ROW_COLUMNS = (
+    Score.id,
+    Score.user_id,
+    User.username,
+    Score.level_type,
+    Score.level_number,
+    Score.completion_time,
+    Score.score,
+    Score.difficulty,
+    Score.created_at,
+)
+
+def score_rows_query():
+    """返回成绩列元组查询（已 JOIN 用户表），过滤条件需使用 Score 列表达式"""
+    return db.session.query(*SCORE_ROW_COLUMNS).join(User, Score.user_id == User.id)
+
+SCORE_ROW_KEYS = tuple(column.key for column in SCORE_ROW_COLUMNS)
+
+def score_row_to_dict(row):
+    """将成绩列元组序列化为与 Score.to_dict() 相同结构的字典。
+    按位置取值（查询须按 SCORE_ROW_COLUMNS 的顺序选列），不经过 Row 的按名查找
+    """
+    score_dict = dict(zip(SCORE_ROW_KEYS, row))
+    score_dict['created_at'] = score_dict['created_at'].isoformat()
+    return score_dict
+
+# 分片中的成绩行不含用户名（用户表在主库），查询后按 user_id 批量补上
+SHARD_ROW_KEYS = tuple(key for key in SCORE_ROW_KEYS if key != 'username')
+ScoreRow = namedtuple('ScoreRow', SCORE_ROW_KEYS)
+
+def shard_rows_select(*conditions):
+    """分片上的成绩列查询（列为 SHARD_ROW_KEYS），条件需使用 score_shards.table.c 的列"""
+    return select(*[score_shards.table.c[key] for key in SHARD_ROW_KEYS]).where(*conditions)
+
+def shard_count_select(*conditions):
+    return select(func.count()).select_from(score_shards.table).where(*conditions)
+
+def shard_rank_columns():
+    table = score_shards.table
+    return (table.c.score, table.c.completion_time, table.c.id)
+
+def shard_rank_key(row):
+    """分片成绩行的排行榜排序键：score DESC, completion_time ASC, id ASC"""
+    return (-row.score, row.completion_time, row.id)
+
+def with_usernames(rows):
+    """为分片成绩行（或未写入主库的 Score 对象）补上用户名，返回按 SCORE_ROW_COLUMNS 排列的 ScoreRow；
+    涉及的用户用一条 IN 查询取出
+    """
+    user_ids = {int(row.user_id) for row in rows}
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(user_ids))) if user_ids else {}
+    return [
+        ScoreRow(username=usernames.get(int(row.user_id)), **{key: getattr(row, key) for key in SHARD_ROW_KEYS})
+        for row in rows
+    ]
+
+def stream_with_usernames(rows, batch_size):
+    """流式版本的 with_usernames：每 batch_size 行查询一次用户名"""
+    rows = iter(rows)
+    for batch in iter(lambda: list(islice(rows, batch_size)), []):
+        yield from with_usernames(batch)
+
+def sharded_leaderboard_rows(level_type='all', level_number=None, difficulty=None, limit=50, after=None, user_id=None):
+    """分片模式的排行榜：各分片并行取前 limit 行后按排行榜顺序归并，返回 ScoreRow 列表。
+    指定 user_id 时只查询该玩家所在的分片
+    """
+    table = score_shards.table
+    conditions = leaderboard_filters(level_type, level_number, difficulty, model=table.c)
+    if after:
+        conditions.append(ranked_after(*after, columns=shard_rank_columns()))
+    if user_id is not None:
+        conditions.append(table.c.user_id == user_id)
+    statement = shard_rows_select(*conditions).order_by(table.c.score.desc(), table.c.completion_time.asc(), table.c.id.asc())
+    if limit >= 0:
+        statement = statement.limit(limit)
+
+    if user_id is not None:
+        return with_usernames(score_shards.fetch(user_id, statement))
+    return with_usernames(score_shards.top(statement, limit, key=shard_rank_key))
+
+def score_level_counts():
+    """各 level_type 的成绩条数（分片模式下为各分片之和）"""
+    if score_shards is None:
+        return dict(db.session.query(Score.level_type, func.count(Score.id)).group_by(Score.level_type))
+    table = score_shards.table
+    counts = Counter()
+    for rows in score_shards.scatter(select(table.c.level_type, func.count()).group_by(table.c.level_type)):
+        counts.update(dict(rows))
+    return dict(counts)
+
+# 用户序列化所需的列，与 User.to_dict() 结构相同
+USER_ROW_COLUMNS = (User.id, User.username, User.email, User.created_at)
+USER_ROW_KEYS = tuple(column.key for column in USER_ROW_COLUMNS)
+
+def user_row_to_dict(row):
+    user_dict = dict(zip(USER_ROW_KEYS, row))
+    user_dict['created_at'] = user_dict['created_at'].isoformat()
+    return user_dict
+
+# 响应格式：full 为成绩对象数组；compact 为按列排列的数组，用户名只在 users 中出现一次
+RESPONSE_FORMATS = ('full', 'compact')
+
+def compact_scores(score_dicts, keys):
+    """把成绩字典列表转为按列排列的 {'columns': {键: [值, ...]}, 'users': {...}}。
+    每行的 user_id / username 换成 users 中的下标（columns['user']），同一玩家的多条成绩共用一项
+    """
+    users = {'user_id': [], 'username': []}
+    user_index = {}
+    value_keys = [key for key in keys if key not in users]
+    columns = {key: [] for key in value_keys}
+    columns['user'] = []
+    for score_dict in score_dicts:
+        user_id = score_dict['user_id']
+        if user_id not in user_index:
+            user_index[user_id] = len(users['user_id'])
+            users['user_id'].append(user_id)
+            users['username'].append(score_dict['username'])
+        columns['user'].append(user_index[user_id])
+        for key in value_keys:
+            columns[key].append(score_dict[key])
+    return {'columns': columns, 'users': users}
+
+def response_format():
+    """请求的响应格式；不支持时抛出 ValueError"""
+    fmt = request.args.get('format', 'full')
+    if fmt not in RESPONSE_FORMATS:
+        raise ValueError(f"format 只能是 {', '.join(RESPONSE_FORMATS)}")
+    return fmt
+
+def leaderboard_filters(level_type='all', level_number=None, difficulty=None, model=Score):
+    """排行榜过滤条件，与 LEADERBOARD_INDEXES 中的索引一一对应"""
+    conditions = []
+    
+    if level_type != 'all':
+        conditions.append(model.level_type == level_type)
+    
+    # 查询参数为字符串，空字符串表示不过滤；0 是合法的关卡编号
+    if level_number is not None and level_number != '':
+        conditions.append(model.level_number == int(level_number))
+    
+    if difficulty:
+        conditions.append(model.difficulty == difficulty)
+    
+    return conditions
+
+def build_leaderboard_query(level_type='all', level_number=None, difficulty=None, after=None):
+    """构建排行榜查询；after 为游标中的 (score, completion_time, id)，只返回排在其后的成绩"""
+    query = score_rows_query().filter(*leaderboard_filters(level_type, level_number, difficulty))
+    if after:
+        query = query.filter(ranked_after(*after))
+    
+    # 按分数降序排列，然后按完成时间升序排列；同分同时间按 id 排序，保证结果稳定
+    return query.order_by(Score.score.desc(), Score.completion_time.asc(), Score.id.asc())
+
+def build_distinct_leaderboard_query(level_type='all', level_number=None, difficulty=None, after=None):
+    """每个玩家只保留一条最佳成绩的排行榜查询，读取 PersonalBest 而不是对 Score 做 GROUP BY"""
+    order = (PersonalBest.score.desc(), PersonalBest.completion_time.asc(), PersonalBest.score_id.asc())
+    filters = leaderboard_filters(level_type, level_number, difficulty, model=PersonalBest)
+    
+    if level_type != 'all' and level_number is not None and level_number != '' and difficulty:
+        # 过滤条件确定唯一的桶时每个玩家只有一条个人最佳，直接在 ix_personal_best_rank 上按序读取前 N 条
+        query = (
+            db.session.query(
+                PersonalBest.score_id.label('id'),
+                PersonalBest.user_id,
+                User.username,
+                PersonalBest.level_type,
+                PersonalBest.level_number,
+                PersonalBest.completion_time,
+                PersonalBest.score,
+                PersonalBest.difficulty,
+                PersonalBest.created_at
+            )
+            .join(User, PersonalBest.user_id == User.id)
+            .filter(*filters)
+            .order_by(*order)
+        )
+        if after:
+            query = query.filter(ranked_after(*after, columns=(PersonalBest.score, PersonalBest.completion_time, PersonalBest.score_id)))
+        return query
+    
+    # 过滤条件跨多个桶时，同一玩家可能有多条个人最佳，用窗口函数只取其中最好的一条。
+    # 需要先对所有匹配的个人最佳排序编号，耗时随个人最佳表的大小增长
+    best_per_user = (
+        db.session.query(
+            PersonalBest,
+            func.row_number().over(partition_by=PersonalBest.user_id, order_by=order).label('user_rank')
+        )
+        .filter(*filters)
+        .subquery()
+    )
+    
+    query = (
+        db.session.query(
+            best_per_user.c.score_id.label('id'),
+            best_per_user.c.user_id,
+            User.username,
+            best_per_user.c.level_type,
+            best_per_user.c.level_number,
+            best_per_user.c.completion_time,
+            best_per_user.c.score,
+            best_per_user.c.difficulty,
+            best_per_user.c.created_at
+        )
+        .join(User, best_per_user.c.user_id == User.id)
+        .filter(best_per_user.c.user_rank == 1)
+        .order_by(best_per_user.c.score.desc(), best_per_user.c.completion_time.asc(), best_per_user.c.score_id.asc())
+    )
+    if after:
+        query = query.filter(ranked_after(*after, columns=(best_per_user.c.score, best_per_user.c.completion_time, best_per_user.c.score_id)))
+    return query
+
+def update_personal_bests(scores):
+    """在当前事务内用一批新成绩（已分配 id）更新个人最佳：按 uq_personal_best_bucket 执行 UPSERT，
+    桶中已有记录时只有新成绩更好才覆盖（同分同时间保留较早的记录）。
+    冲突由唯一索引在同一条语句内判定，并发的首次上传不会重复插入
+    """
+    table = PersonalBest.__table__
+    stmt = sqlite_insert(table)
+    excluded = stmt.excluded
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            table.c.user_id,
+            table.c.level_type,
+            # 冲突目标必须与索引表达式逐字一致，默认值不能作为绑定参数
+            func.coalesce(table.c.level_number, literal_column('-1')),
+            func.coalesce(table.c.difficulty, literal_column("''")),
+        ],
+        set_={
+            'score_id': excluded.score_id,
+            'score': excluded.score,
+            'completion_time': excluded.completion_time,
+            'created_at': excluded.created_at,
+        },
+        where=or_(
+            excluded.score > table.c.score,
+            and_(excluded.score == table.c.score, excluded.completion_time < table.c.completion_time)
+        )
+    )
+    db.session.execute(stmt, [
+        {
+            'user_id': score.user_id,
+            'level_type': score.level_type,
+            'level_number': score.level_number,
+            'difficulty': score.difficulty,
+            'score_id': score.id,
+            'score': score.score,
+            'completion_time': score.completion_time,
+            'created_at': score.created_at,
+        }
+        for score in scores
+    ])
+
+def update_period_tops(scores):
+    """在当前事务内把一批新成绩（已 flush）计入所属的日、周、赛季榜，超出前 K 名的记录随即删除"""
+    groups = set()
+    for score in scores:
+        for period_type, key in period_keys(score.created_at).items():
+            db.session.add(PeriodTop(
+                period_type=period_type,
+                period_key=key,
+                level_type=score.level_type,
+                level_number=score.level_number,
+                difficulty=score.difficulty,
+                score_id=score.id,
+                user_id=score.user_id,
+                score=score.score,
+                completion_time=score.completion_time,
+                created_at=score.created_at
+            ))
+            groups.add((period_type, key, score.level_type, score.level_number, score.difficulty))
+    db.session.flush()
+    
+    for period_type, key, level_type, level_number, difficulty in groups:
+        overflow = (
+            db.session.query(PeriodTop.id)
+            .filter(
+                PeriodTop.period_type == period_type,
+                PeriodTop.period_key == key,
+                PeriodTop.level_type == level_type,
+                PeriodTop.level_number == level_number,
+                PeriodTop.difficulty == difficulty
+            )
+            .order_by(PeriodTop.score.desc(), PeriodTop.completion_time.asc(), PeriodTop.score_id.asc())
+            .offset(app.config['WINDOW_TOP_K'])
+        )
+        ids = [top_id for (top_id,) in overflow]
+        if ids:
+            PeriodTop.query.filter(PeriodTop.id.in_(ids)).delete(synchronize_session=False)
+
+def archive_expired_periods(now=None):
+    """删除超出 WINDOW_RETENTION 的周期榜（原始成绩仍保留在 Score 表中，可用 init_db.py rollup 重建）"""
+    now = now or datetime.utcnow()
+    removed = 0
+    for period_type in WINDOWS:
+        oldest = oldest_retained(period_type, now, app.config['WINDOW_RETENTION'][period_type])
+        removed += PeriodTop.query.filter(
+            PeriodTop.period_type == period_type,
+            PeriodTop.period_key < oldest
+        ).delete(synchronize_session=False)
+    return removed
+
+# 本进程上次写入时的当前周期键；周期切换后的第一次写入顺带清除过期的周期榜
+_current_periods = {}
+
+def archive_on_rollover():
+    now = datetime.utcnow()
+    keys = period_keys(now)
+    if keys != _current_periods:
+        archive_expired_periods(now)
+        _current_periods.update(keys)
+
+def build_window_leaderboard_query(window, period, level_type='all', level_number=None, difficulty=None, after=None):
+    """限时排行榜查询，读取 PeriodTop 汇总表；返回的列与 score_rows_query 相同"""
+    query = (
+        db.session.query(
+            PeriodTop.score_id.label('id'),
+            PeriodTop.user_id,
+            User.username,
+            PeriodTop.level_type,
+            PeriodTop.level_number,
+            PeriodTop.completion_time,
+            PeriodTop.score,
+            PeriodTop.difficulty,
+            PeriodTop.created_at
+        )
+        .join(User, PeriodTop.user_id == User.id)
+        .filter(
+            PeriodTop.period_type == window,
+            PeriodTop.period_key == period,
+            *leaderboard_filters(level_type, level_number, difficulty, model=PeriodTop)
+        )
+    )
+    if after:
+        query = query.filter(ranked_after(*after, columns=(PeriodTop.score, PeriodTop.completion_time, PeriodTop.score_id)))
+    return query.order_by(PeriodTop.score.desc(), PeriodTop.completion_time.asc(), PeriodTop.score_id.asc())
+
+# 成绩上传请求中的字段
+SCORE_FIELDS = ('user_id', 'level_type', 'level_number', 'completion_time', 'score', 'difficulty')
+
+def score_fields(data):
+    """从请求数据中取出成绩字段并转换为列类型（user_id、score、level_number 为整数，completion_time 为浮点数）。
+    缺少必要参数时返回 None，类型不正确时抛出 ValueError。
+    数据库、内存排行榜和响应都使用转换后的值，与 SQL 读出的结果一致
+    """
+    fields = {name: data.get(name) for name in SCORE_FIELDS}
+    if not all([fields['user_id'], fields['level_type'], fields['completion_time'] is not None, fields['score'] is not None]):
+        return None
+    try:
+        fields['user_id'] = int(fields['user_id'])
+        fields['score'] = int(fields['score'])
+        fields['completion_time'] = float(fields['completion_time'])
+        if fields['level_number'] is not None:
+            fields['level_number'] = int(fields['level_number'])
+    except (TypeError, ValueError):
+        raise ValueError('user_id、score、level_number 必须是整数，completion_time 必须是数字')
+    if not math.isfinite(fields['completion_time']):
+        raise ValueError('completion_time 必须是有限的数字')
+    return fields
+
+def check_replays(entries):
+    """校验成绩附带的回放。entries 为 (请求数据, score_fields) 列表，
+    返回每条的 None（通过）或 (状态码, 错误信息)；校验进程池排队已满时抛出 VerifierBusy
+    """
+    mode = app.config['REPLAY_CHECK']
+    problems = [None] * len(entries)
+    if mode == 'off':
+        return problems
+    pending = []
+    for i, (data, fields) in enumerate(entries):
+        replay = data.get('replay')
+        if replay is None:
+            if mode == 'required':
+                problems[i] = (400, '缺少回放数据')
+            continue
+        try:
+            pending.append((i, (parse_replay(replay), fields['completion_time'], fields['score'], fields['level_type'])))
+        except (ReplayError, TypeError, ValueError) as e:
+            problems[i] = (400, f'回放数据无效：{e}')
+    if pending:
+        results = replay_verifier.verify_many([item for _, item in pending])
+        for (i, _), problem in zip(pending, results):
+            if problem is not None:
+                problems[i] = (422, f'成绩与回放不符：{problem}')
+    return problems
+
+# 排行榜排序列：score DESC, completion_time ASC, id ASC
+RANK_COLUMNS = (Score.score, Score.completion_time, Score.id)
+
+def ranked_before(score, completion_time, score_id, columns=RANK_COLUMNS):
+    """排名在给定成绩之前的条件（与排行榜排序规则一致）。
+    外层的 score >= ? 让 SQLite 可以在复合索引上直接定位，而不是从头扫描
+    """
+    score_column, time_column, id_column = columns
+    return and_(score_column >= score, or_(
+        score_column > score,
+        time_column < completion_time,
+        and_(time_column == completion_time, id_column < score_id)
+    ))
+
+def ranked_after(score, completion_time, score_id, columns=RANK_COLUMNS):
+    """排名在给定成绩之后的条件（与排行榜排序规则一致），也用作排行榜的游标分页条件"""
+    score_column, time_column, id_column = columns
+    return and_(score_column <= score, or_(
+        score_column < score,
+        time_column > completion_time,
+        and_(time_column == completion_time, id_column > score_id)
+    ))
+
+# 内存排行榜实例，由 create_tables 加载、upload_score 增量更新
+leaderboard_engine = LeaderboardEngine()
+
+def load_leaderboard_engine():
+    """从数据库全量加载内存排行榜"""
+    if score_shards is None:
+        rows = score_rows_query().yield_per(1000)
+    else:
+        rows = stream_with_usernames(score_shards.stream(shard_rows_select().order_by(score_shards.table.c.id), key=attrgetter('id')), 1000)
+    leaderboard_engine.load(score_row_to_dict(row) for row in rows)
+
+def save_scores(fields_list):
+    """在一个事务中写入一组成绩及个人最佳（只提交一次），同步内存排行榜并返回序列化结果"""
+    new_scores = [Score(**fields) for fields in fields_list]
+    if score_shards is None:
+        db.session.add_all(new_scores)
+        db.session.flush()
+    else:
+        # 成绩行先在各自的分片中提交，取得 ID 后再在主库事务中更新汇总表；Score 对象不加入会话
+        now = datetime.utcnow()
+        for new_score in new_scores:
+            new_score.created_at = now
+        rows = [{key: getattr(new_score, key) for key in SHARD_ROW_KEYS if key != 'id'} for new_score in new_scores]
+        for new_score, score_id in zip(new_scores, score_shards.insert(rows)):
+            new_score.id = score_id
+    update_personal_bests(new_scores)
+    update_period_tops(new_scores)
+    archive_on_rollover()
+    
+    deltas = {'total_scores': len(new_scores)}
+    for new_score in new_scores:
+        name = f'scores:{new_score.level_type}'
+        deltas[name] = deltas.get(name, 0) + 1
+    increment_counters(deltas)
+    
+    # 提交前序列化：提交后对象会过期，再访问属性会逐行重新查询
+    if score_shards is None:
+        score_dicts = [new_score.to_dict() for new_score in new_scores]
+    else:
+        score_dicts = [score_row_to_dict(row) for row in with_usernames(new_scores)]
+    db.session.commit()
+    
+    if leaderboard_engine.loaded:
+        for score_dict in score_dicts:
+            leaderboard_engine.add(dict(score_dict))
+    bump_score_versions(score_dicts)
+    for listener in score_listeners:
+        listener(score_dicts)
+    return score_dicts
+
+# 读接口数据版本号：写入提交后递增，用于生成 ETag
+data_versions = VersionTable()
+
+# 成绩提交后的回调，参数为本次写入的成绩字典列表（asgi.py 注册，用于推送排行榜变化）
+score_listeners = []
+
+def bump_score_versions(score_dicts):
+    """成绩写入后递增受影响的排行榜、个人成绩和统计信息的版本号"""
+    keys = {('stats',)}
+    for score_dict in score_dicts:
+        keys.add(('user', score_dict['user_id']))
+        keys.update(leaderboard_keys_for_score(score_dict['level_type'], score_dict['level_number'], score_dict['difficulty']))
+    data_versions.bump(*keys)
+
+def check_not_modified(etag, private=False):
+    """客户端缓存仍然有效时返回 304 响应，否则返回 None"""
+    if app.config['HTTP_CACHE'] and is_not_modified(request, etag):
+        return not_modified(etag, app.config['HTTP_CACHE_MAX_AGE'], private)
+    return None
+
+def cacheable_json(payload, etag, private=False):
+    """带 ETag / Cache-Control 的 JSON 响应；private 为 True 时共享缓存不得保存（需要登录的个人数据）"""
+    response = jsonify(payload)
+    if app.config['HTTP_CACHE']:
+        set_cache_headers(response, etag, app.config['HTTP_CACHE_MAX_AGE'], private)
+    return response
+
+# 异步写入队列，SCORE_WRITE_BEHIND 开启时由 create_tables 启动
+score_queue = None
+
+def commit_queued_scores(items):
+    """写入线程回调：把队列中的一组成绩在一个事务中写入"""
+    with app.app_context():
+        # 预先载入涉及的用户（保持引用，留在 identity map 中），序列化时不再逐个查询
+        user_ids = {fields['user_id'] for fields in items}
+        users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))}
+        save_scores([fields for fields in items if fields['user_id'] in users])
+
+def start_score_queue():
+    """启动异步写入线程，进程退出时写完队列中剩余的成绩"""
+    global score_queue
+    score_queue = WriteBehindQueue(
+        commit_queued_scores,
+        maxsize=app.config['SCORE_QUEUE_MAXSIZE'],
+        batch_size=app.config['SCORE_QUEUE_BATCH_SIZE'],
+        flush_interval=app.config['SCORE_QUEUE_FLUSH_INTERVAL'],
+        durability=app.config['SCORE_QUEUE_DURABILITY'],
+        journal_path=app.config['SCORE_QUEUE_JOURNAL']
+    )
+    score_queue.start()
+    atexit.register(score_queue.stop)
+
+def bearer_token():
+    header = request.headers.get('Authorization', '')
+    return header[len('Bearer '):].strip() if header.startswith('Bearer ') else None
+
+def token_user_id():
+    """返回请求令牌对应的用户ID；未携带令牌时返回 None，令牌无效时抛出 TokenError"""
+    token = bearer_token()
+    return session_tokens.verify(token) if token else None
+
+def same_user(claimed_user_id, user_id):
+    try:
+        return int(claimed_user_id) == user_id
+    except (TypeError, ValueError):
+        return False
+
+def resolve_user_id(claimed_user_id):
+    """校验请求能否以 claimed_user_id 的身份操作，返回 (用户ID, 错误响应)。
+    携带令牌时以令牌中的用户为准（未提供 user_id 时自动填入）；未携带令牌且 AUTH_REQUIRED 关闭时沿用请求中的 user_id
+    """
+    try:
+        user_id = token_user_id()
+    except TokenError as e:
+        return None, (jsonify({'error': f'登录已失效，请重新登录（{e}）'}), 401)
+    
+    if user_id is None:
+        if app.config['AUTH_REQUIRED']:
+            return None, (jsonify({'error': '请先登录'}), 401)
+        return claimed_user_id, None
+    
+    if claimed_user_id is not None and not same_user(claimed_user_id, user_id):
+        return None, (jsonify({'error': '无权操作其他用户的数据'}), 403)
+    return user_id, None
+
+def token_payload(user):
+    """login / register 响应中附带的会话令牌"""
+    return {
+        'token': session_tokens.issue(user.id),
+        'token_expires_in': app.config['SESSION_TOKEN_MAX_AGE']
+    }
+
+def server_error(e):
+    """接口内未预期的异常：记录堆栈后返回 500"""
+    app.logger.exception('处理 %s %s 时出错', request.method, request.path)
+    return jsonify({'error': str(e)}), 500
+
+def busy_response():
+    """密码哈希或回放校验的进程池排队已满"""
+    response = jsonify({'error': '请求过于频繁，请稍后重试'})
+    response.headers['Retry-After'] = '1'
+    return response, 429
+
 # 用户注册
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -90,15 +953,20 @@ def register():
         user.set_password(password)
         
         db.session.add(user)
+        increment_counters({'total_users': 1})
         db.session.commit()
+        data_versions.bump(('stats',))
         
         return jsonify({
             'message': '注册成功',
-            'user': user.to_dict()
+            'user': user.to_dict(),
+            **token_payload(user)
         }), 201
         
+    except HasherBusy:
+        return busy_response()
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return server_error(e)
 
 # 用户登录
 @app.route('/api/login', methods=['POST'])
@@ -114,149 +982,503 @@ def login():
         user = User.query.filter_by(username=username).first()
         
         if user and user.check_password(password):
+            # 按当前配置的参数升级旧哈希
+            if app.config['PASSWORD_REHASH_ON_LOGIN'] and password_hasher.needs_rehash(user.password_hash):
+                user.set_password(password)
+                db.session.commit()
+            
             return jsonify({
                 'message': '登录成功',
-                'user': user.to_dict()
+                'user': user.to_dict(),
+                **token_payload(user)
             }), 200
         else:
             return jsonify({'error': '用户名或密码错误'}), 401
             
+    except HasherBusy:
+        return busy_response()
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return server_error(e)
+
+# 注销：吊销当前令牌
+@app.route('/api/logout', methods=['POST'])
+def logout():
+    try:
+        token = bearer_token()
+        if not token:
+            return jsonify({'error': '请先登录'}), 401
+        
+        session_tokens.revoke(token)
+        return jsonify({'message': '已退出登录'}), 200
+        
+    except TokenError as e:
+        return jsonify({'error': f'登录已失效，请重新登录（{e}）'}), 401
+    except Exception as e:
+        return server_error(e)
 
 # 上传成绩
 @app.route('/api/scores', methods=['POST'])
 def upload_score():
     try:
         data = request.get_json()
-        user_id = data.get('user_id')
-        level_type = data.get('level_type')
-        completion_time = data.get('completion_time')
-        score = data.get('score')
-        level_number = data.get('level_number')
-        difficulty = data.get('difficulty')
-        
-        if not all([user_id, level_type, completion_time is not None, score is not None]):
+        
+        user_id, auth_error = resolve_user_id(data.get('user_id'))
+        if auth_error:
+            return auth_error
+        data['user_id'] = user_id
+        
+        try:
+            fields = score_fields(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        if fields is None:
             return jsonify({'error': '缺少必要参数'}), 400
         
         # 验证用户是否存在
-        user = User.query.get(user_id)
+        user = User.query.get(fields['user_id'])
         if not user:
             return jsonify({'error': '用户不存在'}), 404
         
-        # 创建成绩记录
-        new_score = Score(
-            user_id=user_id,
-            level_type=level_type,
-            level_number=level_number,
-            completion_time=completion_time,
-            score=score,
-            difficulty=difficulty
-        )
+        problem = check_replays([(data, fields)])[0]
+        if problem:
+            status, message = problem
+            return jsonify({'error': message}), status
         
-        db.session.add(new_score)
-        db.session.commit()
+        # 异步写入模式：放入队列后立即返回，队列满时让客户端稍后重试
+        if score_queue is not None:
+            try:
+                ticket_id = score_queue.submit(fields)
+            except QueueFull:
+                return jsonify({'error': '服务器繁忙，请稍后重试'}), 503
+            return jsonify({
+                'message': '成绩已接收，正在写入',
+                'ticket_id': ticket_id
+            }), 202
+        
+        # 创建成绩记录
+        score_dict = save_scores([fields])[0]
         
         return jsonify({
             'message': '成绩上传成功',
-            'score': new_score.to_dict()
+            'score': score_dict
         }), 201
         
+    except VerifierBusy:
+        return busy_response()
+    except Exception as e:
+        return server_error(e)
+
+# 批量上传成绩（离线缓存的多条成绩一次提交）
+@app.route('/api/scores/batch', methods=['POST'])
+def upload_scores_batch():
+    try:
+        data = request.get_json()
+        items = data.get('scores') if isinstance(data, dict) else data
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': '缺少必要参数'}), 400
+        
+        if len(items) > app.config['SCORE_BATCH_MAX']:
+            return jsonify({'error': f"单次最多上传 {app.config['SCORE_BATCH_MAX']} 条成绩"}), 400
+        
+        try:
+            auth_user_id = token_user_id()
+        except TokenError as e:
+            return jsonify({'error': f'登录已失效，请重新登录（{e}）'}), 401
+        if auth_user_id is None and app.config['AUTH_REQUIRED']:
+            return jsonify({'error': '请先登录'}), 401
+        
+        results = [None] * len(items)
+        accepted = []
+        for i, item in enumerate(items):
+            try:
+                fields = score_fields({'user_id': auth_user_id, **item}) if isinstance(item, dict) else None
+            except ValueError as e:
+                results[i] = {'index': i, 'status': 400, 'error': str(e)}
+                continue
+            if fields is None:
+                results[i] = {'index': i, 'status': 400, 'error': '缺少必要参数'}
+            elif auth_user_id is not None and not same_user(fields['user_id'], auth_user_id):
+                results[i] = {'index': i, 'status': 403, 'error': '无权操作其他用户的数据'}
+            else:
+                if auth_user_id is not None:
+                    fields['user_id'] = auth_user_id
+                accepted.append((i, fields))
+        
+        # 一条 IN 查询验证所有用户
+        user_ids = {fields['user_id'] for _, fields in accepted}
+        users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+        
+        valid = []
+        for i, fields in accepted:
+            if fields['user_id'] not in users:
+                results[i] = {'index': i, 'status': 404, 'error': '用户不存在'}
+            else:
+                valid.append((i, fields))
+        
+        # 所有回放一起提交，由校验进程池攒批推演
+        problems = check_replays([(items[i], fields) for i, fields in valid])
+        for (i, _), problem in zip(valid, problems):
+            if problem:
+                status, message = problem
+                results[i] = {'index': i, 'status': status, 'error': message}
+        valid = [entry for entry, problem in zip(valid, problems) if problem is None]
+        
+        # 所有成绩和个人最佳在同一个事务中写入，只提交一次
+        if valid:
+            score_dicts = save_scores([fields for _, fields in valid])
+            for (i, _), score_dict in zip(valid, score_dicts):
+                results[i] = {'index': i, 'status': 201, 'score': score_dict}
+        
+        return jsonify({
+            'message': '批量上传完成',
+            'accepted': len(valid),
+            'rejected': len(items) - len(valid),
+            'results': results
+        }), 200
+        
+    except VerifierBusy:
+        return busy_response()
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return server_error(e)
 
 # 获取排行榜
 @app.route('/api/leaderboard', methods=['GET'])
+@replica_router.reads
 def get_leaderboard():
     try:
         level_type = request.args.get('level_type', 'all')
         level_number = request.args.get('level_number')
         difficulty = request.args.get('difficulty')
         limit = int(request.args.get('limit', 50))
+        distinct_users = request.args.get('distinct_users', 'false').lower() == 'true'
+        window = request.args.get('window')
+        cursor = request.args.get('cursor')
         
-        query = Score.query
+        try:
+            fmt = response_format()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        # 根据参数过滤
-        if level_type != 'all':
-            query = query.filter_by(level_type=level_type)
+        if window and window not in WINDOWS:
+            return jsonify({'error': f"window 只能是 {', '.join(WINDOWS)}"}), 400
+        if window and distinct_users:
+            return jsonify({'error': '限时排行榜不支持 distinct_users'}), 400
         
-        if level_number:
-            query = query.filter_by(level_number=int(level_number))
+        # 游标分页：游标保存上一页最后一行的 (名次, score, completion_time, id)，下一页从索引中该位置之后开始读取
+        try:
+            start_rank, *after = decode_cursor('leaderboard', cursor) if cursor else (0, None, None, None)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        after = after if cursor else None
         
-        if difficulty:
-            query = query.filter_by(difficulty=difficulty)
+        # 先取版本号再读数据：读取期间若有写入，下次请求的 ETag 会不同
+        etag = data_versions.etag(leaderboard_key(level_type, level_number, difficulty))
+        if window:
+            # 默认读取当前周期；周期切换时即使没有写入 ETag 也随之变化
+            period = request.args.get('period') or period_key(window, datetime.utcnow())
+            etag = f'{etag}-{period}'
+        if fmt != 'full':
+            etag = f'{etag}-{fmt}'
+        cached = check_not_modified(etag)
+        if cached is not None:
+            return cached
         
-        # 按分数降序排列，然后按完成时间升序排列
-        scores = query.order_by(Score.score.desc(), Score.completion_time.asc()).limit(limit).all()
+        if window:
+            # 汇总表每个桶只保留前 K 名，多个桶合并后同样只有前 K 名是准确的
+            remaining = max(app.config['WINDOW_TOP_K'] - start_rank, 0)
+            limit = remaining if limit < 0 else min(limit, remaining)
+            query = build_window_leaderboard_query(window, period, level_type, level_number, difficulty, after)
+            leaderboard = [score_row_to_dict(row) for row in query.limit(limit).all()]
+        elif distinct_users:
+            # 每个玩家只保留最佳成绩，读取个人最佳表
+            query = build_distinct_leaderboard_query(level_type, level_number, difficulty, after)
+            leaderboard = [score_row_to_dict(row) for row in query.limit(limit).all()]
+        elif leaderboard_engine.loaded:
+            leaderboard = leaderboard_engine.top(level_type, level_number, difficulty, limit, after=after)
+        elif score_shards is not None:
+            rows = sharded_leaderboard_rows(level_type, level_number, difficulty, limit, after)
+            leaderboard = [score_row_to_dict(row) for row in rows]
+        else:
+            query = build_leaderboard_query(level_type, level_number, difficulty, after)
+            leaderboard = [score_row_to_dict(row) for row in query.limit(limit).all()]
         
-        leaderboard = []
-        for i, score in enumerate(scores, 1):
-            score_dict = score.to_dict()
+        for i, score_dict in enumerate(leaderboard, start_rank + 1):
             score_dict['rank'] = i
-            leaderboard.append(score_dict)
         
-        return jsonify({
-            'leaderboard': leaderboard,
-            'total_count': len(leaderboard)
-        }), 200
+        next_cursor = None
+        if 0 < limit == len(leaderboard):
+            last = leaderboard[-1]
+            next_cursor = encode_cursor('leaderboard', last['rank'], last['score'], last['completion_time'], last['id'])
+        
+        return cacheable_json({
+            'leaderboard': compact_scores(leaderboard, ('rank', *SCORE_ROW_KEYS)) if fmt == 'compact' else leaderboard,
+            'total_count': len(leaderboard),
+            'next_cursor': next_cursor
+        }, etag), 200
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return server_error(e)
+
+# 查询玩家在排行榜中的名次、百分位及前后 k 名
+@app.route('/api/leaderboard/rank', methods=['GET'])
+@replica_router.reads
+def get_leaderboard_rank():
+    try:
+        user_id = request.args.get('user_id', type=int)
+        level_type = request.args.get('level_type', 'all')
+        level_number = request.args.get('level_number')
+        difficulty = request.args.get('difficulty')
+        # 前后各取 k 名，限制在 0~50 之间
+        k = max(0, min(int(request.args.get('k', 5)), 50))
+        
+        if not user_id:
+            return jsonify({'error': '缺少必要参数'}), 400
+        
+        etag = data_versions.etag(leaderboard_key(level_type, level_number, difficulty))
+        cached = check_not_modified(etag)
+        if cached is not None:
+            return cached
+        
+        if not User.query.get(user_id):
+            return jsonify({'error': '用户不存在'}), 404
+        
+        # 玩家在该排行榜中的最佳成绩。内存排行榜跟随主库，此时最佳成绩也从主库读取，
+        # 避免名次和成绩来自不同步的两个数据源
+        if leaderboard_engine.loaded:
+            g.pop('read_replica', None)
+        if score_shards is None:
+            best = build_leaderboard_query(level_type, level_number, difficulty).filter(Score.user_id == user_id).first()
+        else:
+            best = next(iter(sharded_leaderboard_rows(level_type, level_number, difficulty, 1, user_id=user_id)), None)
+        if not best:
+            return jsonify({'error': '该排行榜中暂无成绩'}), 404
+        
+        rank = leaderboard_engine.rank_of(best.id, level_type, level_number, difficulty) if leaderboard_engine.loaded else None
+        if rank is not None:
+            # 内存排行榜：名次和区间查询均为 O(log n)
+            total = leaderboard_engine.count(level_type, level_number, difficulty)
+            start = max(rank - 1 - k, 0)
+            neighbors = leaderboard_engine.top(level_type, level_number, difficulty, limit=rank + k - start, offset=start)
+        elif score_shards is not None:
+            # 分片：名次为各分片上排在前面的行数之和，前后 k 名由各分片的前 k 行归并得到
+            table = score_shards.table
+            columns = shard_rank_columns()
+            filters = leaderboard_filters(level_type, level_number, difficulty, model=table.c)
+            key = (best.score, best.completion_time, best.id)
+            rank = score_shards.count_rows(shard_count_select(*filters, ranked_before(*key, columns=columns))) + 1
+            total = score_shards.count_rows(shard_count_select(*filters))
+            start = max(rank - 1 - k, 0)
+            
+            above = score_shards.top(
+                shard_rows_select(*filters, ranked_before(*key, columns=columns))
+                .order_by(table.c.score.asc(), table.c.completion_time.desc(), table.c.id.desc()).limit(k),
+                k, key=lambda row: tuple(-value for value in shard_rank_key(row))
+            )
+            below = sharded_leaderboard_rows(level_type, level_number, difficulty, k, after=key)
+            neighbors = [score_row_to_dict(row) for row in [*with_usernames(above[::-1]), best, *below]]
+        else:
+            # 回退到 SQL：排名前后的行数通过复合索引范围计数得到
+            filters = leaderboard_filters(level_type, level_number, difficulty)
+            key = (best.score, best.completion_time, best.id)
+            rank = Score.query.filter(*filters, ranked_before(*key)).count() + 1
+            total = Score.query.filter(*filters).count()
+            start = max(rank - 1 - k, 0)
+            
+            above = (score_rows_query().filter(*filters, ranked_before(*key))
+                     .order_by(Score.score.asc(), Score.completion_time.desc(), Score.id.desc())
+                     .limit(k).all())
+            below = build_leaderboard_query(level_type, level_number, difficulty).filter(ranked_after(*key)).limit(k).all()
+            neighbors = [score_row_to_dict(row) for row in [*reversed(above), best, *below]]
+        
+        for i, score_dict in enumerate(neighbors, start + 1):
+            score_dict['rank'] = i
+        
+        return cacheable_json({
+            'user_id': user_id,
+            'rank': rank,
+            'total_count': total,
+            # 百分位：排名不高于该玩家的成绩所占比例
+            'percentile': round((total - rank + 1) * 100 / total, 2),
+            'score': next(entry for entry in neighbors if entry['id'] == best.id),
+            'neighbors': neighbors
+        }, etag), 200
+        
+    except Exception as e:
+        return server_error(e)
 
 # 获取用户个人成绩
 @app.route('/api/user/<int:user_id>/scores', methods=['GET'])
+@replica_router.reads
 def get_user_scores(user_id):
     try:
-        user = User.query.get(user_id)
+        _, auth_error = resolve_user_id(user_id)
+        if auth_error:
+            return auth_error
+        
+        try:
+            fmt = response_format()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        etag = data_versions.etag(('user', user_id))
+        if fmt != 'full':
+            etag = f'{etag}-{fmt}'
+        cached = check_not_modified(etag, private=True)
+        if cached is not None:
+            return cached
+        
+        user = db.session.query(*USER_ROW_COLUMNS).filter(User.id == user_id).first()
         if not user:
             return jsonify({'error': '用户不存在'}), 404
         
         level_type = request.args.get('level_type')
         limit = int(request.args.get('limit', 20))
+        cursor = request.args.get('cursor')
         
-        query = Score.query.filter_by(user_id=user_id)
+        # 分片模式下只查询该玩家所在的分片
+        model = Score if score_shards is None else score_shards.table.c
+        conditions = [model.user_id == user_id]
         
         if level_type:
-            query = query.filter_by(level_type=level_type)
+            conditions.append(model.level_type == level_type)
         
-        scores = query.order_by(Score.created_at.desc()).limit(limit).all()
+        # 游标分页：游标保存上一页最后一行的 (created_at, id)
+        if cursor:
+            try:
+                created_at, score_id = decode_cursor('history', cursor)
+                created_at = datetime.fromisoformat(created_at)
+            except ValueError:
+                return jsonify({'error': '无效的分页游标'}), 400
+            conditions.append(and_(model.created_at <= created_at, or_(
+                model.created_at < created_at,
+                model.id < score_id
+            )))
         
-        return jsonify({
-            'user': user.to_dict(),
-            'scores': [score.to_dict() for score in scores]
-        }), 200
+        order = (model.created_at.desc(), model.id.desc())
+        if score_shards is None:
+            rows = score_rows_query().filter(*conditions).order_by(*order).limit(limit).all()
+        else:
+            rows = with_usernames(score_shards.fetch(user_id, shard_rows_select(*conditions).order_by(*order).limit(limit)))
+        
+        next_cursor = None
+        if 0 < limit == len(rows):
+            next_cursor = encode_cursor('history', rows[-1].created_at.isoformat(), rows[-1].id)
+        
+        scores = [score_row_to_dict(row) for row in rows]
+        
+        return cacheable_json({
+            'user': user_row_to_dict(user),
+            'scores': compact_scores(scores, SCORE_ROW_KEYS) if fmt == 'compact' else scores,
+            'next_cursor': next_cursor
+        }, etag, private=True), 200
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return server_error(e)
+
+# 导出全部成绩（NDJSON / CSV 流式输出）
+@app.route('/api/export/scores', methods=['GET'])
+@replica_router.reads
+def export_scores():
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"不支持的导出格式: {fmt}"}), 400
+    
+    model = Score if score_shards is None else score_shards.table.c
+    conditions = []
+    
+    # 参数在开始输出前校验完毕，流式响应一旦开始就无法再返回错误状态码
+    try:
+        since = request.args.get('since')
+        until = request.args.get('until')
+        if since:
+            conditions.append(model.created_at >= datetime.fromisoformat(since))
+        if until:
+            conditions.append(model.created_at < datetime.fromisoformat(until))
+    except ValueError:
+        return jsonify({'error': 'since/until 必须是 ISO 8601 格式的时间'}), 400
+    
+    level_type = request.args.get('level_type')
+    if level_type:
+        conditions.append(model.level_type == level_type)
+    
+    # 按主键顺序分批取回，任意时刻只有一批行在内存中；分片模式下按 id 归并各分片的流
+    yield_per = app.config['EXPORT_YIELD_PER']
+    if score_shards is None:
+        rows = (
+            score_rows_query().filter(*conditions)
+            .order_by(Score.id)
+            .execution_options(stream_results=True)
+            .yield_per(yield_per)
+        )
+    else:
+        statement = shard_rows_select(*conditions).order_by(model.id)
+        rows = stream_with_usernames(score_shards.stream(statement, key=attrgetter('id'), yield_per=yield_per), yield_per)
+    columns = [column.key for column in SCORE_ROW_COLUMNS]
+    lines = export_lines(fmt, (score_row_to_dict(row) for row in rows), columns)
+    
+    response = Response(stream_with_context(lines), content_type=EXPORT_FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename=scores.{fmt}'
+    return response
+
+# /api/stats 快照，STATS_CACHE_TTL 秒内直接返回
+_stats_cache = {'payload': None, 'etag': None, 'expires': 0.0}
+_stats_lock = threading.Lock()
+
+def invalidate_stats_cache():
+    with _stats_lock:
+        _stats_cache['payload'] = None
+
+def build_stats():
+    """从计数器表读取统计信息（一次查询），最高分走 ix_score_rank 索引"""
+    counters = dict(db.session.query(StatCounter.name, StatCounter.value))
+    
+    # 最高分
+    if score_shards is None:
+        highest_score = score_rows_query().order_by(Score.score.desc()).first()
+    else:
+        highest_score = next(iter(sharded_leaderboard_rows(limit=1)), None)
+    
+    return {
+        'total_users': counters.get('total_users', 0),
+        'total_scores': counters.get('total_scores', 0),
+        'mode_stats': {
+            'standard': counters.get('scores:standard', 0),
+            'custom': counters.get('scores:custom', 0),
+            'challenge': counters.get('scores:challenge', 0)
+        },
+        'highest_score': score_row_to_dict(highest_score) if highest_score else None
+    }
 
 # 获取统计信息
 @app.route('/api/stats', methods=['GET'])
+@replica_router.reads
 def get_stats():
     try:
-        total_users = User.query.count()
-        total_scores = Score.query.count()
-        
-        # 各模式的成绩统计
-        standard_scores = Score.query.filter_by(level_type='standard').count()
-        custom_scores = Score.query.filter_by(level_type='custom').count()
-        challenge_scores = Score.query.filter_by(level_type='challenge').count()
+        with _stats_lock:
+            if _stats_cache['payload'] is None or time.monotonic() >= _stats_cache['expires']:
+                # ETag 跟随快照生成，快照未刷新前不会出现新 ETag 对应旧数据的情况
+                _stats_cache['etag'] = data_versions.etag(('stats',))
+                _stats_cache['payload'] = build_stats()
+                _stats_cache['expires'] = time.monotonic() + app.config['STATS_CACHE_TTL']
+            stats, etag = _stats_cache['payload'], _stats_cache['etag']
         
-        # 最高分
-        highest_score = Score.query.order_by(Score.score.desc()).first()
+        cached = check_not_modified(etag)
+        if cached is not None:
+            return cached
         
-        return jsonify({
-            'total_users': total_users,
-            'total_scores': total_scores,
-            'mode_stats': {
-                'standard': standard_scores,
-                'custom': custom_scores,
-                'challenge': challenge_scores
-            },
-            'highest_score': highest_score.to_dict() if highest_score else None
-        }), 200
+        return cacheable_json(stats, etag), 200
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return server_error(e)
+
+# Prometheus 指标
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    if not app.config['METRICS']:
+        return jsonify({'error': '未启用指标统计'}), 404
+    return Response(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
 # 健康检查
 @app.route('/api/health', methods=['GET'])
@@ -267,6 +1489,27 @@ def health_check():
 @app.before_first_request
 def create_tables():
     db.create_all()
+    if score_shards is not None:
+        score_shards.create_all()
+    # 计数器表为空（新建或刚升级的数据库）时用真实 COUNT 初始化一次
+    if StatCounter.query.first() is None:
+        reconcile_stat_counters()
+    if app.config['LEADERBOARD_CACHE']:
+        load_leaderboard_engine()
+    if app.config['SCORE_WRITE_BEHIND']:
+        start_score_queue()
+
+def create_app():
+    """生产环境（wsgi.py）使用的应用工厂：补建缺失的表后释放连接池，
+    每个服务进程之后各自建立连接（PRAGMA 在新连接上执行），首次请求时由 create_tables 完成进程内初始化
+    """
+    with app.app_context():
+        db.create_all()
+        if score_shards is not None:
+            score_shards.create_all()
+        for engine in db.engines.values():
+            engine.dispose()
+    return app
 
 if __name__ == '__main__':
     print("\n" + "="*60)
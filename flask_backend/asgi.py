@@ -0,0 +1,198 @@
+"""异步（ASGI）服务入口
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5001
+
+原有接口仍由 Flask 应用处理（a2wsgi 在线程池中运行），新增的 /api/leaderboard/stream 以
+Server-Sent Events 推送排行榜变化。订阅者只是事件循环上的协程，空闲连接不占用线程，
+单个进程可以同时保持数千个订阅。
+
+save_scores 提交后通过 score_listeners 通知本进程的 LeaderboardHub，多个进程之间不会互相
+通知，因此应以单进程运行。
+"""
+from collections import Counter
+from datetime import datetime
+import asyncio
+import json
+import os
+
+import aiosqlite
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+
+from app import (app, db, build_leaderboard_query, create_app, leaderboard_engine,
+                 score_listeners, score_row_to_dict, score_shards, sharded_leaderboard_rows)
+from http_cache import leaderboard_key, leaderboard_keys_for_score
+
+# 没有变化时每隔多少秒发送一次注释行，防止代理断开空闲连接
+STREAM_KEEPALIVE = float(os.environ.get('STREAM_KEEPALIVE', 15))
+STREAM_MAX_LIMIT = 100
+# 运行 Flask 接口的线程数
+ASGI_WSGI_THREADS = int(os.environ.get('ASGI_WSGI_THREADS', 10))
+
+class LeaderboardHub:
+    """事件循环上的排行榜订阅中心
+
+    每个有订阅者的排行榜（过滤条件）有一个版本号，成绩提交后递增并唤醒等待的订阅者。
+    同一版本的排行榜只查询一次并序列化一次，所有订阅者共用结果。
+    最后一个订阅者断开时清除该排行榜的版本号、缓存结果和编译好的 SQL，内存只与当前订阅的排行榜数量有关。
+    """
+
+    def __init__(self):
+        self._db = None
+        self._loop = None
+        self._subscribers = Counter()
+        self._versions = {}
+        self._events = {}
+        self._boards = {}
+        self._statements = {}
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        with app.app_context():
+            path = db.engine.url.database
+        self._db = await aiosqlite.connect(path)
+        for name, value in app.config['SQLITE_PRAGMAS'].items():
+            await self._db.execute(f'PRAGMA {name} = {value}')
+        score_listeners.append(self.publish)
+
+    async def stop(self):
+        score_listeners.remove(self.publish)
+        await self._db.close()
+
+    def publish(self, score_dicts):
+        """在写入线程中调用：把受影响的排行榜交给事件循环处理"""
+        keys = set()
+        for score_dict in score_dicts:
+            keys.update(leaderboard_keys_for_score(score_dict['level_type'], score_dict['level_number'], score_dict['difficulty']))
+        self._loop.call_soon_threadsafe(self._changed, keys)
+
+    def _changed(self, keys):
+        # 没有订阅者的排行榜也没有缓存，不需要记录版本号
+        for key in keys & self._subscribers.keys():
+            self._versions[key] = self._versions.get(key, 0) + 1
+            event = self._events.pop(key, None)
+            if event is not None:
+                event.set()
+
+    def subscribe(self, key):
+        self._subscribers[key] += 1
+
+    def unsubscribe(self, key):
+        self._subscribers[key] -= 1
+        if self._subscribers[key] > 0:
+            return
+        del self._subscribers[key]
+        self._versions.pop(key, None)
+        self._events.pop(key, None)
+        for board_key in [board_key for board_key in self._boards if board_key[0] == key]:
+            del self._boards[board_key]
+        for statement_key in [statement_key for statement_key in self._statements if leaderboard_key(*statement_key[0]) == key]:
+            del self._statements[statement_key]
+
+    async def wait(self, key, version, timeout):
+        """等到排行榜版本号不再是 version 或超时，返回当前版本号"""
+        if self._versions.get(key, 0) == version:
+            event = self._events.setdefault(key, asyncio.Event())
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self._versions.get(key, 0)
+
+    async def board(self, filters, limit):
+        """返回 (版本号, 序列化后的排行榜)；同一版本的并发请求共用一次查询"""
+        key = leaderboard_key(*filters)
+        version = self._versions.get(key, 0)
+        cached = self._boards.get((key, limit))
+        if cached is None or cached[0] != version:
+            cached = (version, asyncio.ensure_future(self._read_board(filters, limit)))
+            self._boards[(key, limit)] = cached
+        try:
+            # shield：某个订阅者断开时不取消其他订阅者共用的查询
+            return version, await asyncio.shield(cached[1])
+        except Exception:
+            if self._boards.get((key, limit)) is cached:
+                del self._boards[(key, limit)]
+            raise
+
+    async def _read_board(self, filters, limit):
+        if leaderboard_engine.loaded:
+            board = leaderboard_engine.top(*filters, limit)
+        elif score_shards is not None:
+            # 分片查询是同步的，放到线程池中执行
+            board = await self._loop.run_in_executor(None, self._read_shards, filters, limit)
+        else:
+            sql, params = self._statement(filters, limit)
+            async with self._db.execute(sql, params) as cursor:
+                board = [score_row_to_dict(self._to_row(values)) for values in await cursor.fetchall()]
+        for i, score_dict in enumerate(board, 1):
+            score_dict['rank'] = i
+        return json.dumps({'leaderboard': board}, ensure_ascii=False)
+
+    @staticmethod
+    def _read_shards(filters, limit):
+        with app.app_context():
+            return [score_row_to_dict(row) for row in sharded_leaderboard_rows(*filters, limit)]
+
+    def _statement(self, filters, limit):
+        """把 build_leaderboard_query 编译为 SQL 文本和位置参数（按过滤条件缓存）"""
+        if (filters, limit) not in self._statements:
+            with app.app_context():
+                compiled = build_leaderboard_query(*filters).limit(limit).statement.compile(db.engine)
+            self._statements[(filters, limit)] = (str(compiled), tuple(compiled.params[name] for name in compiled.positiontup))
+        return self._statements[(filters, limit)]
+
+    @staticmethod
+    def _to_row(values):
+        # SQLite 中的 DateTime 以字符串保存，created_at 是最后一列
+        return (*values[:-1], datetime.fromisoformat(values[-1]))
+
+hub = LeaderboardHub()
+
+async def leaderboard_stream(request):
+    """以 SSE 推送排行榜：连接后先发送当前前 limit 名，之后每当名次发生变化时再发送"""
+    level_type = request.query_params.get('level_type', 'all')
+    level_number = request.query_params.get('level_number')
+    difficulty = request.query_params.get('difficulty')
+    try:
+        # limit 为负数时 SQLite 和内存排行榜都会返回全部成绩，限制在 1~STREAM_MAX_LIMIT 之间
+        limit = max(1, min(int(request.query_params.get('limit', 10)), STREAM_MAX_LIMIT))
+        level_number = int(level_number) if level_number else None
+    except ValueError:
+        return JSONResponse({'error': 'limit 和 level_number 必须是整数'}, status_code=400)
+
+    filters = (level_type, level_number, difficulty)
+    key = leaderboard_key(*filters)
+
+    async def events():
+        sent = None
+        hub.subscribe(key)
+        try:
+            while True:
+                version, payload = await hub.board(filters, limit)
+                # 新成绩没有进入前 limit 名时排行榜不变，不重复推送
+                if payload != sent:
+                    yield f'id: {version}\nevent: leaderboard\ndata: {payload}\n\n'
+                    sent = payload
+                if await hub.wait(key, version, STREAM_KEEPALIVE) == version:
+                    yield ': keepalive\n\n'
+        finally:
+            # 客户端断开时生成器被关闭
+            hub.unsubscribe(key)
+
+    return StreamingResponse(events(), media_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # 经过 Nginx 时关闭响应缓冲
+        'Access-Control-Allow-Origin': '*',
+    })
+
+application = Starlette(
+    routes=[
+        Route('/api/leaderboard/stream', leaderboard_stream),
+        Mount('/', app=WSGIMiddleware(create_app(), workers=ASGI_WSGI_THREADS)),
+    ],
+    on_startup=[hub.start],
+    on_shutdown=[hub.stop],
+)
@@ -0,0 +1,652 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""后端性能基准测试
+
+所有测试都在临时 SQLite 数据库上进行，不会影响 game_data.db。load 和 workers 通过 gunicorn
+子进程测试真实 HTTP 服务，其余通过 Flask 测试客户端在进程内进行。
+
+    python benchmark.py batch --runs 1000 --batch-size 50
+    python benchmark.py mixed --threads 8 --duration 5
+    python benchmark.py sqlite --threads 8 --duration 5
+    python benchmark.py paging --seed-scores 600000 --pages 1 100 10000
+    python benchmark.py workers --workers 1 2 4 8 --clients 16 --duration 10
+    python benchmark.py load --users 1000 --seed-scores 200000 --output results.json
+    python benchmark.py load --transport http --workers 4 --compare results.json
+    python benchmark.py json --rows 500
+    python benchmark.py compression --rows 500
+    python benchmark.py replay --runs 512 --workers 1 2 4 --threads 32
+"""
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+def load_app(db_path):
+    """在导入 app 之前把 DATABASE_URL 指向临时数据库"""
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    import app as backend
+    with backend.app.app_context():
+        backend.db.create_all()
+    return backend
+
+def seed_users(backend, count):
+    """直接写入测试用户（共用一个密码哈希，避免逐个计算 PBKDF2）"""
+    from werkzeug.security import generate_password_hash
+    password_hash = generate_password_hash('benchmark')
+    with backend.app.app_context():
+        backend.db.session.execute(
+            backend.User.__table__.insert(),
+            [{'username': f'bench{i}', 'password_hash': password_hash} for i in range(count)]
+        )
+        backend.db.session.commit()
+        return [user_id for (user_id,) in backend.db.session.query(backend.User.id)]
+
+def seed_scores(backend, user_ids, count, chunk_size=5000):
+    """用 Core executemany 批量写入随机成绩"""
+    with backend.app.app_context():
+        for start in range(0, count, chunk_size):
+            rows = [random_run(user_ids) for _ in range(min(chunk_size, count - start))]
+            backend.db.session.execute(backend.Score.__table__.insert(), rows)
+            backend.db.session.commit()
+
+def seed_database(backend, args):
+    """按 --users × --seed-scores 生成合成数据库：成绩的上传时间分布在最近 --days 天内，
+    再用 init_db.py 的回填函数生成个人最佳、周期排行榜和统计计数器
+    """
+    import init_db
+    user_ids = seed_users(backend, args.users)
+    now = datetime.utcnow()
+    with backend.app.app_context():
+        for start in range(0, args.seed_scores, 5000):
+            rows = [
+                dict(random_run(user_ids), created_at=now - timedelta(seconds=random.uniform(0, args.days * 86400)))
+                for _ in range(min(5000, args.seed_scores - start))
+            ]
+            backend.db.session.execute(backend.Score.__table__.insert(), rows)
+            backend.db.session.commit()
+    init_db.backfill_personal_bests()
+    init_db.rebuild_period_tops()
+    with backend.app.app_context():
+        backend.reconcile_stat_counters()
+    return user_ids
+
+def random_run(user_ids):
+    return {
+        'user_id': random.choice(user_ids),
+        'level_type': random.choice(['standard', 'custom', 'challenge']),
+        'level_number': random.randint(1, 5),
+        'completion_time': round(random.uniform(10, 90), 2),
+        'score': random.randint(100, 2000),
+        'difficulty': random.choice(['easy', 'medium', 'hard'])
+    }
+
+def report(name, count, elapsed):
+    print(f"{name:<28} {count:>8} 条  {elapsed:>8.3f} s  {count / elapsed:>10.1f} 条/秒")
+
+def bench_batch(backend, args):
+    """单条上传接口与批量上传接口的写入吞吐对比"""
+    user_ids = seed_users(backend, args.users)
+    client = backend.app.test_client()
+    runs = [random_run(user_ids) for _ in range(args.runs)]
+
+    start = time.perf_counter()
+    for run in runs:
+        response = client.post('/api/scores', json=run)
+        assert response.status_code == 201, response.get_json()
+    single = time.perf_counter() - start
+    report('POST /api/scores', len(runs), single)
+
+    start = time.perf_counter()
+    for i in range(0, len(runs), args.batch_size):
+        response = client.post('/api/scores/batch', json={'scores': runs[i:i + args.batch_size]})
+        assert response.status_code == 200 and not response.get_json()['rejected'], response.get_json()
+    batch = time.perf_counter() - start
+    report(f'POST /api/scores/batch ×{args.batch_size}', len(runs), batch)
+
+    print(f"批量接口加速比: {single / batch:.1f}x")
+
+def bench_mixed(backend, args):
+    """多线程并发读写混合负载：按 write_ratio 混合上传成绩与排行榜/个人成绩查询"""
+    user_ids = seed_users(backend, args.users)
+    seed_scores(backend, user_ids, args.seed_scores)
+
+    counts = {'read': 0, 'write': 0, 'error': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + args.duration
+
+    def worker():
+        client = backend.app.test_client()
+        local = {'read': 0, 'write': 0, 'error': 0}
+        while time.perf_counter() < deadline:
+            if random.random() < args.write_ratio:
+                kind, response = 'write', client.post('/api/scores', json=random_run(user_ids))
+            elif random.random() < 0.5:
+                kind, response = 'read', client.get(f"/api/leaderboard?level_type={random.choice(['standard', 'custom', 'challenge'])}")
+            else:
+                kind, response = 'read', client.get(f'/api/user/{random.choice(user_ids)}/scores')
+            local['error' if response.status_code >= 500 else kind] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    result = {
+        'profile': os.environ.get('SQLITE_PROFILE', 'tuned'),
+        'reads_per_sec': counts['read'] / args.duration,
+        'writes_per_sec': counts['write'] / args.duration,
+        'errors': counts['error'],
+    }
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"配置 {result['profile']}: 读 {result['reads_per_sec']:.1f} 次/秒, "
+              f"写 {result['writes_per_sec']:.1f} 次/秒, 错误 {result['errors']} 次")
+
+def bench_paging(backend, args):
+    """游标分页在不同页深度上的延迟，并与同深度的 OFFSET 查询对比"""
+    user_ids = seed_users(backend, args.users)
+    seed_scores(backend, user_ids, args.seed_scores)
+    client = backend.app.test_client()
+    limit = args.page_size
+
+    print(f"{'页码':>8} {'游标 ms/次':>12} {'OFFSET ms/次':>14}")
+    for page in args.pages:
+        offset = (page - 1) * limit
+        if offset >= args.seed_scores:
+            print(f"{page:>8} 超出已写入的成绩条数，跳过")
+            continue
+        with backend.app.app_context():
+            query = backend.build_leaderboard_query()
+            url = f'/api/leaderboard?limit={limit}'
+            if offset:
+                # 上一页最后一行，即客户端翻到该页时持有的游标
+                last = query.offset(offset - 1).limit(1).one()
+                url += '&cursor=' + backend.encode_cursor('leaderboard', offset, last.score, last.completion_time, last.id)
+
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                query.offset(offset).limit(limit).all()
+            offset_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            response = client.get(url)
+            assert response.status_code == 200, response.get_json()
+        cursor_ms = (time.perf_counter() - start) * 1000 / args.repeat
+        print(f"{page:>8} {cursor_ms:>12.2f} {offset_ms:>14.2f}")
+
+def compare_sqlite_profiles(args):
+    """在独立子进程中分别以 default / tuned 配置运行 mixed 负载并对比"""
+    results = []
+    for profile in ('default', 'tuned'):
+        env = dict(os.environ, SQLITE_PROFILE=profile, LEADERBOARD_CACHE='0')
+        command = [
+            sys.executable, os.path.abspath(__file__), 'mixed', '--json',
+            '--users', str(args.users), '--seed-scores', str(args.seed_scores),
+            '--threads', str(args.threads), '--duration', str(args.duration),
+            '--write-ratio', str(args.write_ratio), '--seed', str(args.seed)
+        ]
+        output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'配置':<10} {'读/秒':>10} {'写/秒':>10} {'错误':>8}")
+    for result in results:
+        print(f"{result['profile']:<10} {result['reads_per_sec']:>10.1f} {result['writes_per_sec']:>10.1f} {result['errors']:>8}")
+
+def http_client_load(port, paths, deadline, seed):
+    """压测客户端进程：保持一条长连接循环发送 GET 请求直到 deadline，返回 (成功数, 失败数)"""
+    rng = random.Random(seed)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    ok = failed = 0
+    while time.time() < deadline:
+        try:
+            conn.request('GET', rng.choice(paths))
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                ok += 1
+            else:
+                failed += 1
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.close()
+    return ok, failed
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'服务在 {timeout} 秒内未就绪')
+
+@contextmanager
+def gunicorn_server(workers, port, env):
+    """在子进程中启动 gunicorn，等到 /api/health 可访问后返回，退出时停止"""
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', config, 'wsgi:application',
+         '--workers', str(workers), '--bind', f'127.0.0.1:{port}'],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_for_server(port)
+        yield server
+    finally:
+        server.terminate()
+        server.wait()
+
+def compare_worker_counts(args):
+    """用 gunicorn 分别以不同 worker 数启动服务，多个客户端进程并发读取，对比吞吐随核数的变化"""
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'benchmark.db')
+        backend = load_app(db_path)
+        user_ids = seed_users(backend, args.users)
+        seed_scores(backend, user_ids, args.seed_scores)
+        with backend.app.app_context():
+            backend.db.engine.dispose()
+
+        paths = [f"/api/leaderboard?level_type={level_type}&limit=50" for level_type in ('standard', 'custom', 'challenge')]
+        paths += [f'/api/user/{user_id}/scores' for user_id in user_ids[:50]]
+        # 各 worker 数下统一关闭进程内缓存，每个请求都访问数据库
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}', LEADERBOARD_CACHE='0', HTTP_CACHE='0')
+
+        print(f"{'worker 数':>10} {'请求/秒':>12} {'失败':>8} {'加速比':>8}")
+        baseline = None
+        for workers in args.workers:
+            with gunicorn_server(workers, args.port, env):
+                deadline = time.time() + args.duration
+                with multiprocessing.Pool(args.clients) as pool:
+                    results = pool.starmap(http_client_load, [
+                        (args.port, paths, deadline, args.seed + i) for i in range(args.clients)
+                    ])
+
+            throughput = sum(ok for ok, _ in results) / args.duration
+            baseline = baseline or throughput
+            print(f"{workers:>10} {throughput:>12.1f} {sum(failed for _, failed in results):>8} {throughput / baseline:>7.2f}x")
+
+def load_requests(user_ids, write_ratio):
+    """混合负载中的请求种类：(接口名, 权重, 生成 (method, path, json) 的函数)"""
+    level_types = ['standard', 'custom', 'challenge']
+    read_weight = 1 - write_ratio
+    return [
+        ('POST /api/scores', write_ratio, lambda rng: ('POST', '/api/scores', random_run(user_ids))),
+        ('GET /api/leaderboard', read_weight * 0.35, lambda rng: (
+            'GET', f"/api/leaderboard?level_type={rng.choice(level_types)}&level_number={rng.randint(1, 5)}&limit=50", None)),
+        ('GET /api/leaderboard?window', read_weight * 0.15, lambda rng: (
+            'GET', f"/api/leaderboard?window={rng.choice(['day', 'week', 'season'])}&level_type={rng.choice(level_types)}", None)),
+        ('GET /api/leaderboard/rank', read_weight * 0.2, lambda rng: (
+            'GET', f"/api/leaderboard/rank?user_id={rng.choice(user_ids)}&level_type={rng.choice(level_types)}", None)),
+        ('GET /api/user/<id>/scores', read_weight * 0.2, lambda rng: (
+            'GET', f'/api/user/{rng.choice(user_ids)}/scores', None)),
+        ('GET /api/stats', read_weight * 0.1, lambda rng: ('GET', '/api/stats', None)),
+    ]
+
+def drive_load(send, kinds, deadline, seed):
+    """按权重随机发送请求直到 deadline，返回 {接口名: ([耗时秒...], 失败数)}"""
+    rng = random.Random(seed)
+    names = [name for name, _, _ in kinds]
+    weights = [weight for _, weight, _ in kinds]
+    builders = {name: build for name, _, build in kinds}
+    results = {name: ([], 0) for name in names}
+    while time.time() < deadline:
+        name = rng.choices(names, weights)[0]
+        method, path, body = builders[name](rng)
+        start = time.perf_counter()
+        try:
+            ok = send(method, path, body) < 500
+        except (OSError, http.client.HTTPException):
+            ok = False
+        latencies, errors = results[name]
+        if ok:
+            latencies.append(time.perf_counter() - start)
+        else:
+            results[name] = (latencies, errors + 1)
+    return results
+
+def http_load_worker(port, user_ids, write_ratio, deadline, seed):
+    """HTTP 模式的客户端进程（保持一条长连接）"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+
+    def send(method, path, body):
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            raise
+
+    return drive_load(send, load_requests(user_ids, write_ratio), deadline, seed)
+
+def percentile(sorted_values, p):
+    """最近秩法百分位数"""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(p / 100 * len(sorted_values))) - 1))]
+
+def summarize(partials, duration):
+    """合并各客户端的结果，计算每个接口的吞吐和 p50/p95/p99（毫秒）"""
+    merged = {}
+    for partial in partials:
+        for name, (latencies, errors) in partial.items():
+            all_latencies, all_errors = merged.get(name, ([], 0))
+            merged[name] = (all_latencies + latencies, all_errors + errors)
+
+    summary = {}
+    for name, (latencies, errors) in sorted(merged.items()):
+        latencies.sort()
+        summary[name] = {
+            'count': len(latencies),
+            'errors': errors,
+            'throughput': len(latencies) / duration,
+            **{f'p{p}': percentile(latencies, p) * 1000 if latencies else None for p in (50, 95, 99)},
+        }
+    return summary
+
+def print_summary(summary):
+    print(f"{'接口':<30} {'请求数':>8} {'失败':>6} {'次/秒':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in summary.items():
+        latencies = ' '.join(f"{stats[p]:>9.2f}" if stats[p] is not None else f"{'-':>9}" for p in ('p50', 'p95', 'p99'))
+        print(f"{name:<30} {stats['count']:>8} {stats['errors']:>6} {stats['throughput']:>10.1f} {latencies}")
+
+def find_regressions(summary, baseline, tolerance):
+    """与基线结果对比：吞吐下降或 p95 上升超过 tolerance（比例）的接口"""
+    regressions = []
+    for name, stats in summary.items():
+        before = baseline.get(name)
+        if not before or not stats['count'] or not before['count']:
+            continue
+        if stats['throughput'] < before['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: 吞吐 {before['throughput']:.1f} -> {stats['throughput']:.1f} 次/秒")
+        if stats['p95'] > before['p95'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95']:.2f} -> {stats['p95']:.2f} ms")
+    return regressions
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def bench_load(backend, args):
+    """在合成数据库上运行读写混合负载，按接口统计吞吐和延迟百分位，可写出 JSON 并与基线对比"""
+    user_ids = seed_database(backend, args)
+    with backend.app.app_context():
+        backend.db.engine.dispose()
+
+    if args.transport == 'http':
+        db_path = backend.app.config['SQLALCHEMY_DATABASE_URI'][len('sqlite:///'):]
+        env = dict(os.environ, DATABASE_URL=f'sqlite:///{db_path}')
+        with gunicorn_server(args.workers[0], args.port, env):
+            deadline = time.time() + args.duration
+            with multiprocessing.Pool(args.clients) as pool:
+                partials = pool.starmap(http_load_worker, [
+                    (args.port, user_ids, args.write_ratio, deadline, args.seed + i) for i in range(args.clients)
+                ])
+    else:
+        kinds = load_requests(user_ids, args.write_ratio)
+        deadline = time.time() + args.duration
+        partials = []
+        lock = threading.Lock()
+
+        def worker(seed):
+            client = backend.app.test_client()
+            send = lambda method, path, body: client.open(path, method=method, json=body).status_code
+            result = drive_load(send, kinds, deadline, seed)
+            with lock:
+                partials.append(result)
+
+        threads = [threading.Thread(target=worker, args=(args.seed + i,)) for i in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    summary = summarize(partials, args.duration)
+    print_summary(summary)
+
+    if args.output:
+        result = {
+            'commit': git_commit(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'transport': args.transport,
+            'config': {
+                'users': args.users, 'seed_scores': args.seed_scores, 'duration': args.duration,
+                'write_ratio': args.write_ratio, 'threads': args.threads, 'clients': args.clients,
+                'workers': args.workers[0], 'profile': os.environ.get('SQLITE_PROFILE', 'tuned'),
+            },
+            'endpoints': summary,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = find_regressions(summary, baseline['endpoints'], args.tolerance)
+        for line in regressions:
+            print(f"✗ {line}")
+        print(f"与 {baseline.get('commit') or args.compare} 对比：" + (f"{len(regressions)} 项退化" if regressions else "无退化"))
+        return 1 if regressions else 0
+
+def bench_json(backend, args):
+    """构建 --rows 行排行榜响应的耗时：ORM to_dict 与列元组序列化、标准库与 orjson 后端对比（不含查询）"""
+    from sqlalchemy.orm import joinedload
+    from json_provider import JSON_PROVIDERS, orjson
+
+    user_ids = seed_users(backend, args.users)
+    seed_scores(backend, user_ids, max(args.rows, 1000))
+    with backend.app.test_request_context():
+        rows = backend.build_leaderboard_query().limit(args.rows).all()
+        # 预先 JOIN 载入 user，只比较序列化本身
+        objects = backend.Score.query.options(joinedload(backend.Score.user)).limit(args.rows).all()
+        serializers = {
+            'Score.to_dict()': lambda: [score.to_dict() for score in objects],
+            'score_row_to_dict': lambda: [backend.score_row_to_dict(row) for row in rows],
+        }
+        providers = {name: cls(backend.app) for name, cls in JSON_PROVIDERS.items() if name != 'orjson' or orjson}
+        if not orjson:
+            print("未安装 orjson，只测试标准库后端")
+
+        print(f"{'序列化':<20} {'JSON 后端':<8} {'ms/次':>10}")
+        for serializer_name, serialize in serializers.items():
+            for provider_name, provider in providers.items():
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    provider.response({'leaderboard': serialize(), 'total_count': args.rows}).get_data()
+                elapsed = (time.perf_counter() - start) * 1000 / args.repeat
+                print(f"{serializer_name:<20} {provider_name:<8} {elapsed:>10.2f}")
+
+def bench_compression(backend, args):
+    """--rows 行排行榜与个人成绩响应的字节数和编码耗时：full / compact 格式 × 不压缩 / gzip / br"""
+    from response_compression import brotli
+
+    user_ids = seed_users(backend, args.users)
+    seed_scores(backend, user_ids, max(args.rows * 2, 1000))
+    seed_scores(backend, user_ids[:1], args.rows)  # 个人成绩响应取第一个用户的 --rows 条
+    compressor = backend.response_compressor
+    encodings = ('identity', *reversed(compressor.encodings))
+    if not brotli:
+        print("未安装 brotli，只测试 gzip")
+
+    with backend.app.test_request_context():
+        leaderboard = [backend.score_row_to_dict(row) for row in backend.build_leaderboard_query().limit(args.rows).all()]
+        for i, score_dict in enumerate(leaderboard, 1):
+            score_dict['rank'] = i
+        history = [backend.score_row_to_dict(row) for row in
+                   backend.score_rows_query().filter(backend.Score.user_id == user_ids[0]).limit(args.rows).all()]
+        payloads = {
+            ('leaderboard', 'full'): lambda: {'leaderboard': leaderboard},
+            ('leaderboard', 'compact'): lambda: {'leaderboard': backend.compact_scores(leaderboard, ('rank', *backend.SCORE_ROW_KEYS))},
+            ('user_scores', 'full'): lambda: {'scores': history},
+            ('user_scores', 'compact'): lambda: {'scores': backend.compact_scores(history, backend.SCORE_ROW_KEYS)},
+        }
+
+        print(f"{'接口':<12} {'格式':<8} {'编码':<9} {'字节':>9} {'ms/次':>8}")
+        for (endpoint, fmt), build in payloads.items():
+            for encoding in encodings:
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    body = backend.app.json.response(build()).get_data()
+                    if encoding != 'identity':
+                        body = compressor.compress(body, encoding)
+                elapsed = (time.perf_counter() - start) * 1000 / args.repeat
+                print(f"{endpoint:<12} {fmt:<8} {encoding:<9} {len(body):>9} {elapsed:>8.2f}")
+
+def synthetic_replays(count, rnd, max_frames=3000):
+    """生成 count 条能通关的回放：向下倾斜并带随机左右晃动，两侧有障碍物和陷阱"""
+    from replay_check import SCORE_RULES, WON, parse_replay, simulate
+
+    def level():
+        obstacles = [[x, y, x + 120, y + 40] for x in (60, 900) for y in range(200, 1800, 160)]
+        traps = [[x, y, x + 60, y + 60] for x in (220, 800) for y in range(400, 1700, 220)]
+        frame, inputs = 0, []
+        while frame < max_frames:
+            inputs.append([frame, rnd.uniform(-0.3, 0.3), rnd.uniform(0.1, 0.5)])
+            frame += rnd.randint(1, 8)
+        return {'width': 1080, 'height': 1920, 'radius': 30, 'start': [540, 200],
+                'goal': [390, 1600, 690, 1800], 'obstacles': obstacles, 'traps': traps,
+                'frames': max_frames, 'inputs': inputs}
+
+    replays = []
+    while len(replays) < count:
+        candidates = [level() for _ in range(count - len(replays))]
+        for replay, (outcome, end_frame) in zip(candidates, simulate([parse_replay(r) for r in candidates])):
+            if outcome == WON:
+                replay['frames'] = end_frame + 1
+                replay['inputs'] = [sample for sample in replay['inputs'] if sample[0] <= end_frame]
+                replays.append(replay)
+    items = []
+    for replay in replays:
+        completion_time = round(replay['frames'] * 0.0085, 3)
+        items.append((parse_replay(replay), completion_time, SCORE_RULES['challenge'](completion_time), 'challenge'))
+    return items
+
+def compare_replay_batches(args):
+    """回放校验吞吐：当前进程内不同批次大小的推演速度，以及 ReplayVerifier 不同进程数下多线程逐条提交的吞吐"""
+    from replay_check import ReplayVerifier, check_batch, np
+    if np is None:
+        print('回放校验需要先安装 numpy')
+        return 1
+
+    items = synthetic_replays(args.runs, random.Random(args.seed))
+    frames = sum(item[0][7] for item in items)
+    print(f"{len(items)} 条回放，平均 {frames / len(items):.0f} 帧")
+
+    print(f"{'批次大小':<10} {'回放/秒':>10} {'帧/秒':>12}")
+    for batch_size in (1, 16, 64, 256):
+        start = time.perf_counter()
+        for i in range(0, len(items), batch_size):
+            problems = check_batch(items[i:i + batch_size])
+            assert not any(problems), problems
+        elapsed = time.perf_counter() - start
+        print(f"{batch_size:<10} {len(items) / elapsed:>10.1f} {frames / elapsed:>12.0f}")
+
+    print(f"\n{'进程数':<10} {'回放/秒':>10}  （{args.threads} 个线程逐条提交）")
+    for workers in args.workers:
+        verifier = ReplayVerifier(workers=workers, max_pending=len(items))
+        try:
+            verifier.verify_many(items[:1])  # 启动进程池
+            pending = list(items)
+            lock = threading.Lock()
+
+            def submit():
+                while True:
+                    with lock:
+                        if not pending:
+                            return
+                        item = pending.pop()
+                    assert verifier.verify_many([item]) == [None]
+
+            threads = [threading.Thread(target=submit) for _ in range(args.threads)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+        finally:
+            verifier.shutdown()
+        print(f"{workers:<10} {len(items) / elapsed:>10.1f}")
+
+BENCHMARKS = {
+    'batch': bench_batch,
+    'mixed': bench_mixed,
+    'paging': bench_paging,
+    'load': bench_load,
+    'json': bench_json,
+    'compression': bench_compression,
+}
+
+# 自行启动子进程、不在当前进程加载 app 的对比测试
+COMPARISONS = {
+    'sqlite': compare_sqlite_profiles,
+    'workers': compare_worker_counts,
+    'replay': compare_replay_batches,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='重力球游戏后端性能基准测试')
+    parser.add_argument('benchmark', choices=sorted([*BENCHMARKS, *COMPARISONS]))
+    parser.add_argument('--users', type=int, default=100, help='测试用户数')
+    parser.add_argument('--runs', type=int, default=1000, help='上传的成绩条数 / 回放测试的回放条数')
+    parser.add_argument('--batch-size', type=int, default=50, help='批量接口每次提交的条数')
+    parser.add_argument('--seed-scores', type=int, default=20000, help='预先写入的成绩条数')
+    parser.add_argument('--threads', type=int, default=8, help='并发线程数')
+    parser.add_argument('--duration', type=float, default=5, help='混合负载持续秒数')
+    parser.add_argument('--write-ratio', type=float, default=0.2, help='混合负载中写请求的比例')
+    parser.add_argument('--page-size', type=int, default=50, help='分页测试每页条数')
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 100, 10000], help='分页测试的页码')
+    parser.add_argument('--repeat', type=int, default=50, help='分页 / JSON / 压缩测试的重复次数')
+    parser.add_argument('--rows', type=int, default=500, help='JSON / 压缩测试的响应行数')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='多进程测试的 worker 数')
+    parser.add_argument('--clients', type=int, default=16, help='多进程测试的客户端进程数')
+    parser.add_argument('--port', type=int, default=5099, help='多进程测试的服务端口')
+    parser.add_argument('--days', type=int, default=90, help='合成成绩的上传时间分布在最近多少天内')
+    parser.add_argument('--transport', choices=['inprocess', 'http'], default='inprocess',
+                        help='load 测试通过 Flask 测试客户端（多线程）或 gunicorn HTTP 服务（多进程客户端）发送请求')
+    parser.add_argument('--output', help='把 load 测试结果写入 JSON 文件')
+    parser.add_argument('--compare', help='与之前写出的 JSON 结果对比，出现退化时以状态码 1 退出')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='对比时允许的吞吐下降 / p95 上升比例')
+    parser.add_argument('--json', action='store_true', help='以 JSON 输出结果')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.benchmark in COMPARISONS:
+        return COMPARISONS[args.benchmark](args)
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = load_app(os.path.join(tmp, 'benchmark.db'))
+        status = BENCHMARKS[args.benchmark](backend, args)
+        with backend.app.app_context():
+            backend.db.engine.dispose()
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
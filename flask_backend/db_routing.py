@@ -0,0 +1,52 @@
+"""读副本路由
+
+READ_REPLICAS 配置一组只读副本（SQLite 文件）。用 ReplicaRouter.reads 装饰的读接口在请求期间
+把 db.session 的查询轮流发往其中一个副本；其余接口和所有写入（flush）仍使用主库。
+
+SQLite 没有内置复制，副本由 init_db.py replicate 用在线备份 API 从主库复制，读到的数据
+可能落后于主库一个复制周期。进程内的 HTTP 缓存版本号只跟随主库，配置副本时默认关闭 HTTP_CACHE，
+避免把落后的数据以新的 ETag 缓存下来。
+"""
+import functools
+import itertools
+import os
+import threading
+
+from flask import g, has_app_context
+from flask_sqlalchemy.session import Session
+
+def database_urls(value):
+    """逗号分隔的 SQLite 文件路径或连接串 -> 连接串列表"""
+    items = (item.strip() for item in value.split(','))
+    return [item if '://' in item else f'sqlite:///{os.path.abspath(item)}' for item in items if item]
+
+class ReplicaRouter:
+    def __init__(self, bind_keys):
+        self.bind_keys = list(bind_keys)
+        self._next = itertools.cycle(self.bind_keys)
+        self._lock = threading.Lock()
+
+    def choose(self):
+        with self._lock:
+            return next(self._next)
+
+    def reads(self, view):
+        """读接口装饰器：本次请求的查询发往一个副本。
+        选中的副本保存在 g 中直到请求结束，流式响应在视图返回后执行的查询同样读副本
+        """
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if self.bind_keys:
+                g.read_replica = self.choose()
+            return view(*args, **kwargs)
+        return wrapper
+
+class RoutingSession(Session):
+    """当前请求选中了副本且不在 flush 中时，把查询发往副本，否则按 Flask-SQLAlchemy 默认规则选择引擎"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get('read_replica')
+            if replica is not None:
+                return self._db.engines[replica]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
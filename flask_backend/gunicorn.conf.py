@@ -0,0 +1,51 @@
+"""Gunicorn 配置：多进程 prefork 部署
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+- worker 数默认等于 CPU 核数（WEB_CONCURRENCY），每个 worker 内 GUNICORN_THREADS 个线程
+- 每处理 GUNICORN_MAX_REQUESTS 个请求后回收 worker（带随机抖动，避免同时重启）
+- kill -HUP <master pid> 平滑重载：新 worker 重新导入代码后旧 worker 处理完当前请求再退出
+- 不使用 preload_app：master 不导入应用，SQLite 连接和 PRAGMA 在每个 worker 中各自建立
+
+内存排行榜和 HTTP 缓存版本号保存在进程内，多个 worker 之间不共享，
+因此 worker 数大于 1 时默认关闭 LEADERBOARD_CACHE 和 HTTP_CACHE。
+每个 worker 各自创建密码哈希和回放校验进程池，默认大小按 worker 数均分 CPU 核数，
+避免 N 个 worker 各开 N 个计算进程。
+令牌注销记录默认保存在数据库中（TOKEN_REVOCATION=database），由所有 worker 共享；
+TOKEN_REVOCATION=memory 时注销只在处理 logout 的 worker 中生效，多 worker 部署拒绝启动。
+"""
+import multiprocessing
+import os
+import subprocess
+import sys
+
+basedir = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5001')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+preload_app = False
+chdir = basedir
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')  # 设为 - 输出到标准输出
+errorlog = '-'
+
+if workers > 1:
+    # 在 master 中设置，fork 出的 worker 继承
+    os.environ.setdefault('LEADERBOARD_CACHE', '0')
+    os.environ.setdefault('HTTP_CACHE', '0')
+    helper_processes = str(max(1, multiprocessing.cpu_count() // workers))
+    os.environ.setdefault('PASSWORD_HASH_WORKERS', helper_processes)
+    os.environ.setdefault('REPLAY_WORKERS', helper_processes)
+    if os.environ.get('SCORE_WRITE_BEHIND') == '1':
+        raise RuntimeError('SCORE_WRITE_BEHIND 的写入日志不能由多个 worker 共用，请使用 WEB_CONCURRENCY=1 或关闭异步写入')
+    if os.environ.get('TOKEN_REVOCATION') == 'memory':
+        raise RuntimeError('TOKEN_REVOCATION=memory 的注销记录不能在多个 worker 之间共享，请使用 WEB_CONCURRENCY=1 或 TOKEN_REVOCATION=database')
+
+def on_starting(server):
+    """启动 worker 之前在独立进程中补建表和索引，master 本身不导入应用，保证 SIGHUP 能加载新代码"""
+    subprocess.run([sys.executable, os.path.join(basedir, 'init_db.py'), 'migrate'], check=True, cwd=basedir)
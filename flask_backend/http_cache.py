@@ -0,0 +1,71 @@
+"""读接口的 HTTP 缓存（ETag / If-None-Match / Cache-Control）
+
+写接口提交后递增对应数据的版本号，读接口用版本号生成 ETag。客户端带着相同的
+If-None-Match 再次请求时直接返回 304，不查询数据库也不重新序列化。
+
+版本号保存在进程内存中，ETag 带有进程启动时生成的 epoch，进程重启后旧 ETag 自动失效。
+"""
+from collections import defaultdict
+import threading
+import uuid
+
+from flask import Response
+
+class VersionTable:
+    """按键计数的进程内版本号"""
+
+    def __init__(self):
+        self._versions = defaultdict(int)
+        self._lock = threading.Lock()
+        self.epoch = uuid.uuid4().hex[:8]
+
+    def bump(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._versions[key] += 1
+
+    def etag(self, *keys):
+        """由若干键的当前版本号组成的 ETag 值（不含引号）。
+        只读不写：从未 bump 过的键版本号为 0，不会因为任意的查询参数组合在表中留下条目
+        """
+        with self._lock:
+            versions = '.'.join(str(self._versions.get(key, 0)) for key in keys)
+        return f'{self.epoch}-{versions}'
+
+def leaderboard_key(level_type='all', level_number=None, difficulty=None):
+    """排行榜请求对应的版本键，过滤语义与 build_leaderboard_query 一致"""
+    return (
+        'leaderboard',
+        level_type if level_type != 'all' else None,
+        int(level_number) if level_number is not None and level_number != '' else None,
+        difficulty or None,
+    )
+
+def leaderboard_keys_for_score(level_type, level_number, difficulty):
+    """一条成绩会影响的所有排行榜过滤组合的版本键"""
+    return {
+        ('leaderboard', type_filter, number_filter, difficulty_filter)
+        for type_filter in (level_type, None)
+        for number_filter in ({level_number, None})
+        for difficulty_filter in ({difficulty or None, None})
+    }
+
+def is_not_modified(request, etag):
+    return request.if_none_match.contains_weak(etag)
+
+def set_cache_headers(response, etag, max_age, private=False):
+    """设置 ETag 和 Cache-Control；max_age 为 0 时客户端每次都需要重新验证。
+    private 用于按登录用户区分的响应：只允许客户端自己缓存，并按 Authorization 区分缓存条目
+    """
+    response.set_etag(etag)
+    if private:
+        response.cache_control.private = True
+        response.vary.add('Authorization')
+    else:
+        response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.must_revalidate = True
+    return response
+
+def not_modified(etag, max_age, private=False):
+    return set_cache_headers(Response(status=304), etag, max_age, private)
@@ -1,5 +1,27 @@
-from app import app, db, User, Score
-from datetime import datetime
+from app import (app, db, User, Score, PersonalBest, PeriodTop, ARCHIVED_COUNTER_PREFIX, LEADERBOARD_INDEXES, SHARD_ROW_KEYS, basedir,
+                 build_leaderboard_query, score_row_to_dict, increment_counters, leaderboard_engine, load_leaderboard_engine,
+                 reconcile_stat_counters, score_level_counts, score_shards, sharded_leaderboard_rows, with_usernames)
+from leaderboard_windows import WINDOWS, oldest_retained, period_keys
+from score_retention import (ARCHIVE_FORMATS, analyze_scores, enable_incremental_vacuum, reclaim_free_pages,
+                             retained_ids, storage_stats, write_archive)
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from functools import partial
+from heapq import heappush, heappushpop
+from operator import attrgetter
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import make_url
+from werkzeug.security import generate_password_hash
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import time
 
 def init_database():
     """初始化数据库并添加测试数据"""
@@ -7,6 +29,9 @@ def init_database():
         # 删除所有表并重新创建
         db.drop_all()
         db.create_all()
+        if score_shards is not None:
+            score_shards.drop_all()
+            score_shards.create_all()
         
         # 创建测试用户
         test_users = [
@@ -53,11 +78,18 @@ def init_database():
             {'user_id': 3, 'level_type': 'custom', 'level_number': None, 'completion_time': 40.5, 'score': 700, 'difficulty': 'easy'}
         ]
         
-        for score_data in test_scores:
-            score = Score(**score_data)
-            db.session.add(score)
+        if score_shards is None:
+            for score_data in test_scores:
+                score = Score(**score_data)
+                db.session.add(score)
+            
+            db.session.commit()
+        else:
+            score_shards.insert([dict(score_data, created_at=datetime.utcnow()) for score_data in test_scores])
         
-        db.session.commit()
+        backfill_personal_bests()
+        rebuild_period_tops()
+        reconcile_stat_counters()
         
         print("数据库初始化完成！")
         print(f"创建了 {len(test_users)} 个测试用户")
@@ -66,5 +98,486 @@ def init_database():
         for user_data in test_users:
             print(f"用户名: {user_data['username']}, 密码: {user_data['password']}")
 
+# 重建汇总表时扫描的成绩列
+SCAN_COLUMNS = ('id', 'user_id', 'level_type', 'level_number', 'difficulty', 'score', 'completion_time', 'created_at')
+
+def scan_scores(batch_size):
+    """按主键顺序流式扫描全部成绩（分片模式下按 id 归并各分片的结果）"""
+    if score_shards is None:
+        columns = [getattr(Score, name) for name in SCAN_COLUMNS]
+        return db.session.query(*columns).order_by(Score.id).yield_per(batch_size)
+    table = score_shards.table
+    statement = select(*[table.c[name] for name in SCAN_COLUMNS]).order_by(table.c.id)
+    return score_shards.stream(statement, key=attrgetter('id'), yield_per=batch_size)
+
+def backfill_personal_bests(batch_size=1000):
+    """按主键顺序流式扫描一遍 Score 表，重建个人最佳表"""
+    with app.app_context():
+        best = {}
+        for row in scan_scores(batch_size):
+            key = (row.user_id, row.level_type, row.level_number, row.difficulty)
+            current = best.get(key)
+            # 按 id 升序扫描，同分同时间时保留先出现的记录
+            if current is None or (row.score, -row.completion_time) > (current['score'], -current['completion_time']):
+                best[key] = {
+                    'user_id': row.user_id,
+                    'level_type': row.level_type,
+                    'level_number': row.level_number,
+                    'difficulty': row.difficulty,
+                    'score_id': row.id,
+                    'score': row.score,
+                    'completion_time': row.completion_time,
+                    'created_at': row.created_at
+                }
+        
+        values = list(best.values())
+        with db.engine.begin() as conn:
+            conn.execute(PersonalBest.__table__.delete())
+            for start in range(0, len(values), batch_size):
+                conn.execute(PersonalBest.__table__.insert(), values[start:start + batch_size])
+        
+        print(f"个人最佳表回填完成，共 {len(values)} 条")
+
+def rebuild_period_tops(batch_size=1000):
+    """流式扫描 Score 表，重建保留期内各周期榜的前 K 名"""
+    with app.app_context():
+        top_k = app.config['WINDOW_TOP_K']
+        now = datetime.utcnow()
+        oldest = {window: oldest_retained(window, now, app.config['WINDOW_RETENTION'][window]) for window in WINDOWS}
+        
+        # 每个 (周期, 桶) 用大小为 K 的小顶堆保留排名最靠前的成绩，堆顶是其中排名最低的一条
+        heaps = {}
+        for row in scan_scores(batch_size):
+            rank_key = (row.score, -row.completion_time, -row.id)
+            for window, key in period_keys(row.created_at).items():
+                if key < oldest[window]:
+                    continue
+                heap = heaps.setdefault((window, key, row.level_type, row.level_number, row.difficulty), [])
+                entry = (rank_key, row)
+                if len(heap) < top_k:
+                    heappush(heap, entry)
+                elif rank_key > heap[0][0]:
+                    heappushpop(heap, entry)
+        
+        values = [
+            {
+                'period_type': window,
+                'period_key': key,
+                'level_type': row.level_type,
+                'level_number': row.level_number,
+                'difficulty': row.difficulty,
+                'score_id': row.id,
+                'user_id': row.user_id,
+                'score': row.score,
+                'completion_time': row.completion_time,
+                'created_at': row.created_at
+            }
+            for (window, key, *_), heap in heaps.items()
+            for _, row in heap
+        ]
+        with db.engine.begin() as conn:
+            conn.execute(PeriodTop.__table__.delete())
+            for start in range(0, len(values), batch_size):
+                conn.execute(PeriodTop.__table__.insert(), values[start:start + batch_size])
+        
+        print(f"周期排行榜重建完成，共 {len(heaps)} 个周期榜、{len(values)} 条")
+
+def reconcile_stats():
+    """用真实 COUNT 结果校正 /api/stats 使用的计数器"""
+    with app.app_context():
+        mismatches = reconcile_stat_counters()
+        for name, (stored, actual) in mismatches.items():
+            print(f"已校正 {name}: {stored} -> {actual}")
+        print("统计计数器与真实数据一致" if not mismatches else f"共校正 {len(mismatches)} 项计数器")
+
+def migrate_indexes():
+    """在已有数据库上补建新增的表和索引（不删除数据）"""
+    with app.app_context():
+        db.create_all()
+        if score_shards is not None:
+            score_shards.create_all()
+            print(f"成绩分片已就绪: {score_shards.count} 个")
+        
+        # 表达式索引无法通过 SQLAlchemy 反射检测，直接读取 sqlite_master
+        with db.engine.connect() as conn:
+            existing = {row[0] for row in conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=db.engine)
+                print(f"索引已就绪: {index.name}")
+        
+        # 更新统计信息，帮助查询规划器选择索引
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+        print("索引迁移完成")
+
+def check_query_plans():
+    """用 EXPLAIN QUERY PLAN 检查每种排行榜过滤组合都命中了对应索引且无需临时排序"""
+    if score_shards is not None:
+        print("分片模式：排行榜查询在各分片上执行，跳过主库查询计划检查")
+        return
+    
+    sample_values = {'level_type': 'standard', 'level_number': 1, 'difficulty': 'easy'}
+    failures = []
+    
+    with app.app_context():
+        for filters, index_name in LEADERBOARD_INDEXES.items():
+            params = {column: sample_values[column] for column in filters}
+            query = build_leaderboard_query(**params).limit(50)
+            compiled = query.statement.compile(db.engine)
+            args = tuple(compiled.params[name] for name in compiled.positiontup)
+            
+            with db.engine.connect() as conn:
+                rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', args).fetchall()
+            plan = ' | '.join(row[-1] for row in rows)
+            
+            ok = index_name in plan and 'TEMP B-TREE' not in plan
+            print(f"{'✓' if ok else '✗'} {filters or ('all',)}: {plan}")
+            if not ok:
+                failures.append(index_name)
+    
+    assert not failures, f"以下索引未被查询规划器使用: {', '.join(failures)}"
+    print("所有排行榜查询均使用了复合索引")
+
+def check_leaderboard_engine():
+    """检查内存排行榜与 SQL 查询在每种过滤组合下返回完全相同的结果"""
+    sample_values = {'level_type': 'standard', 'level_number': 1, 'difficulty': 'easy'}
+    failures = []
+    
+    with app.app_context():
+        load_leaderboard_engine()
+        for filters in LEADERBOARD_INDEXES:
+            params = {column: sample_values[column] for column in filters}
+            if score_shards is None:
+                expected = [score_row_to_dict(row) for row in build_leaderboard_query(**params).all()]
+            else:
+                expected = [score_row_to_dict(row) for row in sharded_leaderboard_rows(limit=-1, **params)]
+            actual = leaderboard_engine.top(limit=-1, **params)
+            
+            ok = actual == expected
+            print(f"{'✓' if ok else '✗'} {filters or ('all',)}: {len(actual)} 条")
+            if not ok:
+                failures.append(filters)
+    
+    assert not failures, f"内存排行榜与 SQL 结果不一致: {failures}"
+    print("内存排行榜与 SQL 查询结果一致")
+
+def replicate_database():
+    """用 SQLite 在线备份 API 把主库完整复制到每个只读副本（READ_REPLICAS），复制期间主库照常读写"""
+    replicas = app.config['READ_REPLICAS']
+    if not replicas:
+        print("未配置 READ_REPLICAS")
+        return
+    
+    with app.app_context():
+        source = sqlite3.connect(db.engine.url.database)
+    try:
+        for url in replicas:
+            path = make_url(url).database
+            start = time.perf_counter()
+            target = sqlite3.connect(path)
+            try:
+                source.backup(target)
+            finally:
+                target.close()
+            print(f"已复制到 {path}（{time.perf_counter() - start:.2f} 秒）")
+    finally:
+        source.close()
+
+# 导入文件中可选的成绩字段及其类型（与 /api/export/scores 的输出一致）
+IMPORT_SCORE_FIELDS = {
+    'id': int,
+    'user_id': int,
+    'level_type': str,
+    'level_number': int,
+    'completion_time': float,
+    'score': int,
+    'difficulty': str,
+    'created_at': datetime.fromisoformat,
+}
+
+def read_chunks(path, chunk_size, offset=0):
+    """按行分块读取 NDJSON / CSV 文件，产出 (记录列表, 块结束处的字节偏移)。
+    CSV 首行为表头；offset 为上次中断时记录的偏移，从该处继续读取
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    is_csv = path.removesuffix('.gz').endswith('.csv')
+    with opener(path, 'rb') as f:
+        header = next(csv.reader([f.readline().decode('utf-8-sig')])) if is_csv else None
+        if offset:
+            f.seek(offset)
+        chunk = []
+        for line in iter(f.readline, b''):
+            text = line.decode('utf-8').strip()
+            if not text:
+                continue
+            chunk.append(dict(zip(header, next(csv.reader([text])))) if is_csv else json.loads(text))
+            if len(chunk) >= chunk_size:
+                yield chunk, f.tell()
+                chunk = []
+        if chunk:
+            yield chunk, f.tell()
+
+def parse_score(record):
+    """把一条导入记录转换为 Score 表的列值；CSV 中的空字符串视为 NULL"""
+    row = {}
+    for name, convert in IMPORT_SCORE_FIELDS.items():
+        value = record.get(name)
+        row[name] = None if value is None or value == '' else convert(value)
+    # 显式写入 NULL 会绕过列默认值
+    row['created_at'] = row['created_at'] or datetime.utcnow()
+    return row
+
+def import_users(path, chunk_size=1000, workers=None):
+    """从 NDJSON / CSV 导入用户（username、password、email），用多进程并行计算密码哈希，已存在的用户名跳过。
+    实际新增的用户数在同一事务内计入 total_users 计数器
+    """
+    with app.app_context():
+        hash_password = partial(generate_password_hash, method=app.config['PASSWORD_HASH_METHOD'])
+        stmt = sqlite_insert(User.__table__).on_conflict_do_nothing(index_elements=['username'])
+        total = 0
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for records, _ in read_chunks(path, chunk_size):
+                hashes = pool.map(hash_password, [record['password'] for record in records], chunksize=16)
+                rows = [
+                    {'username': record['username'], 'email': record.get('email') or None,
+                     'password_hash': password_hash, 'created_at': datetime.utcnow()}
+                    for record, password_hash in zip(records, hashes)
+                ]
+                with db.engine.begin() as conn:
+                    created = conn.execute(stmt, rows).rowcount
+                    if created:
+                        increment_counters({'total_users': created}, conn)
+                total += len(rows)
+                print(f"已导入用户 {total} 个（{total / (time.perf_counter() - start):.0f} 个/秒）")
+
+def resolve_user_ids(conn, rows, records, user_ids):
+    """记录中带 username 时按用户名对应到本库的用户ID，不存在的用户以不可登录的密码哈希创建"""
+    names = {record['username'] for record in records if record.get('username')} - user_ids.keys()
+    if names:
+        existing = conn.execute(db.select(User.id, User.username).where(User.username.in_(names)))
+        user_ids.update({username: user_id for user_id, username in existing})
+        missing = names - user_ids.keys()
+        if missing:
+            conn.execute(User.__table__.insert(), [
+                {'username': username, 'password_hash': '!', 'created_at': datetime.utcnow()} for username in missing
+            ])
+            created = conn.execute(db.select(User.id, User.username).where(User.username.in_(missing)))
+            user_ids.update({username: user_id for user_id, username in created})
+    for row, record in zip(rows, records):
+        if record.get('username'):
+            row['user_id'] = user_ids[record['username']]
+
+def import_scores(path, chunk_size=50000, checkpoint_path=None):
+    """批量导入成绩转储（/api/export/scores 的 NDJSON / CSV 输出）
+
+    - 每块用一条 executemany 在一个事务中写入，导入期间先删除 Score 表的二级索引，结束后统一重建
+    - 每块提交后把文件偏移写入检查点，中断后再次运行从检查点继续；带 id 的记录用 INSERT OR IGNORE，重复导入同一块不会产生重复数据
+    - 全部导入后重建个人最佳、周期排行榜和统计计数器
+    """
+    checkpoint_path = checkpoint_path or f'{path}.checkpoint'
+    checkpoint = {'offset': 0, 'rows': 0}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+        print(f"从检查点继续：已导入 {checkpoint['rows']} 条")
+    
+    with app.app_context():
+        db.create_all()
+        # 逐行维护索引远慢于导入后一次性建立
+        for index in Score.__table__.indexes:
+            index.drop(bind=db.engine, checkfirst=True)
+        
+        stmt = Score.__table__.insert().prefix_with('OR IGNORE')
+        user_ids = {}
+        imported = 0
+        start = time.perf_counter()
+        for records, offset in read_chunks(path, chunk_size, checkpoint['offset']):
+            rows = [parse_score(record) for record in records]
+            with db.engine.begin() as conn:
+                resolve_user_ids(conn, rows, records, user_ids)
+                conn.execute(stmt, rows)
+            
+            imported += len(rows)
+            checkpoint = {'offset': offset, 'rows': checkpoint['rows'] + len(rows)}
+            with open(checkpoint_path, 'w', encoding='utf-8') as f:
+                json.dump(checkpoint, f)
+            print(f"已导入 {checkpoint['rows']} 条（本次 {imported / (time.perf_counter() - start):.0f} 条/秒）")
+        
+        elapsed = time.perf_counter() - start
+        print(f"成绩导入完成：本次 {imported} 条，用时 {elapsed:.1f} 秒（{imported / max(elapsed, 1e-9):.0f} 条/秒）")
+    
+    migrate_indexes()
+    backfill_personal_bests()
+    rebuild_period_tops()
+    reconcile_stats()
+    os.remove(checkpoint_path)
+
+def measure_score_queries(repeat=20):
+    """依赖 score 表大小的几类查询的耗时中位数（毫秒）：无过滤排行榜、最高分、按关卡类型计数"""
+    if score_shards is None:
+        queries = {
+            'leaderboard': lambda: build_leaderboard_query().limit(50).all(),
+            'highest_score': lambda: build_leaderboard_query().first(),
+        }
+    else:
+        queries = {
+            'leaderboard': lambda: sharded_leaderboard_rows(limit=50),
+            'highest_score': lambda: sharded_leaderboard_rows(limit=1),
+        }
+    queries['level_counts'] = score_level_counts
+    
+    timings = {}
+    for name, query in queries.items():
+        query()  # 预热：编译缓存和页缓存
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            query()
+            samples.append((time.perf_counter() - start) * 1000)
+        timings[name] = statistics.median(samples)
+    db.session.close()
+    return timings
+
+def archive_scores(keep_top=10, keep_days=90, archive_dir=None, fmt='ndjson', chunk_size=5000,
+                   vacuum='incremental', analysis_limit=1000, repeat=20):
+    """把热表中不再需要的旧成绩分块写入按月分区的归档并删除，逐块回收空间，最后报告回收的空间和查询延迟变化（见 score_retention.py）"""
+    archive_dir = archive_dir or os.path.join(basedir, 'archive')
+    if app.config['LEADERBOARD_CACHE']:
+        print("警告：LEADERBOARD_CACHE 已开启，运行中服务的内存排行榜在重启前仍会返回已归档的成绩，归档后需要重启服务",
+              file=sys.stderr)
+    with app.app_context():
+        engines = score_shards.engines if score_shards is not None else [db.engine]
+        table = score_shards.table if score_shards is not None else Score.__table__
+        cutoff = datetime.utcnow() - timedelta(days=keep_days)
+        
+        latency_before = measure_score_queries(repeat)
+        size_before = sum(storage_stats(engine)[0] for engine in engines)
+        
+        if vacuum == 'incremental':
+            for engine in engines:
+                if enable_incremental_vacuum(engine):
+                    print(f"{engine.url.database}: 已切换为 auto_vacuum=INCREMENTAL（执行了一次完整 VACUUM）")
+        
+        # 个人最佳和周期榜引用的成绩始终保留，重建这两张表（backfill / rollup）的结果不受归档影响
+        pinned = {score_id for (score_id,) in db.session.query(PersonalBest.score_id)}
+        pinned.update(score_id for (score_id,) in db.session.query(PeriodTop.score_id))
+        keep = retained_ids(scan_scores(chunk_size), keep_top, cutoff, pinned)
+        # 结束会话中的读事务，否则删除时会等待它的共享锁，WAL 检查点也无法截短文件
+        db.session.close()
+        print(f"热表保留 {len(keep)} 条成绩（每个玩家每个桶前 {keep_top} 名、最近 {keep_days} 天、个人最佳及周期榜）")
+        
+        archive = ARCHIVE_FORMATS[fmt](archive_dir)
+        columns = [table.c[key] for key in SHARD_ROW_KEYS]
+        delete = table.delete().where(table.c.id == bindparam('score_id'))
+        archived = 0
+        paths = set()
+        start = time.perf_counter()
+        for engine in engines:
+            last_id = 0
+            while True:
+                with engine.connect() as conn:
+                    rows = conn.execute(
+                        select(*columns)
+                        .where(table.c.id > last_id, table.c.created_at < cutoff)
+                        .order_by(table.c.id)
+                        .limit(chunk_size)
+                    ).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                rows = [row for row in rows if row.id not in keep]
+                if not rows:
+                    continue
+                
+                # 归档落盘后才删除：中断时最多重复归档一块，不会丢失成绩
+                score_dicts = [score_row_to_dict(row) for row in with_usernames(rows)]
+                db.session.close()
+                paths |= write_archive(archive, score_dicts)
+                # 统计计数器是累计值，不因归档减少；已归档的条数单独记录，reconcile 时加回
+                archived_counts = {f'{ARCHIVED_COUNTER_PREFIX}total_scores': len(rows)}
+                for row in rows:
+                    name = f'{ARCHIVED_COUNTER_PREFIX}scores:{row.level_type}'
+                    archived_counts[name] = archived_counts.get(name, 0) + 1
+                with engine.begin() as conn:
+                    conn.execute(delete, [{'score_id': row.id} for row in rows])
+                    # 计数器在主库中，未分片时与删除在同一事务内提交
+                    if engine is db.engine:
+                        increment_counters(archived_counts, conn)
+                if engine is not db.engine:
+                    with db.engine.begin() as conn:
+                        increment_counters(archived_counts, conn)
+                if vacuum == 'incremental':
+                    reclaim_free_pages(engine)
+                
+                archived += len(rows)
+                print(f"已归档 {archived} 条（{archived / (time.perf_counter() - start):.0f} 条/秒）")
+        
+        for engine in engines:
+            if vacuum == 'full':
+                with engine.connect() as conn:
+                    conn.exec_driver_sql('VACUUM')
+            analyze_scores(engine, table.name, analysis_limit)
+        
+        size_after, free_after = (sum(values) for values in zip(*(storage_stats(engine) for engine in engines)))
+        latency_after = measure_score_queries(repeat)
+        
+        print(f"归档完成：{archived} 条成绩写入 {len(paths)} 个归档文件（{archive_dir}）")
+        print(f"数据库大小：{size_before / 2**20:.1f} MB -> {size_after / 2**20:.1f} MB，"
+              f"回收 {(size_before - size_after) / 2**20:.1f} MB（剩余空闲页 {free_after / 2**20:.1f} MB）")
+        print("查询耗时中位数（毫秒）：")
+        for name, before in latency_before.items():
+            print(f"  {name:<14} {before:8.2f} -> {latency_after[name]:8.2f}")
+
 if __name__ == '__main__':
-    init_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='重力球游戏数据库工具')
+    parser.add_argument('command', nargs='?', default='init', choices=['init', 'migrate', 'backfill', 'rollup', 'reconcile', 'check', 'import', 'replicate', 'archive'],
+                        help='init: 重建数据库并写入测试数据; migrate: 为已有数据库补建表和索引; '
+                             'backfill: 从已有成绩重建个人最佳表; rollup: 重建日/周/赛季排行榜; reconcile: 校正统计计数器; '
+                             'check: 检查排行榜查询计划及内存排行榜一致性; import: 从 NDJSON / CSV 文件批量导入用户和成绩; '
+                             'replicate: 把主库复制到 READ_REPLICAS 中的只读副本; archive: 把旧成绩归档到压缩文件并回收空间')
+    parser.add_argument('path', nargs='?', help='import: 成绩文件（.ndjson / .csv）')
+    parser.add_argument('--users', help='import: 用户文件（username、password、email），先于成绩导入')
+    parser.add_argument('--chunk-size', type=int, help='import / archive: 每个事务写入 / 删除的成绩条数（默认 50000 / 5000）')
+    parser.add_argument('--checkpoint', help='import: 检查点文件（默认为成绩文件名加 .checkpoint）')
+    parser.add_argument('--workers', type=int, help='import: 计算密码哈希的进程数（默认 CPU 核数）')
+    parser.add_argument('--keep-top', type=int, default=10, help='archive: 每个玩家每个桶保留的最佳成绩条数')
+    parser.add_argument('--keep-days', type=int, default=90, help='archive: 保留最近多少天内的全部成绩')
+    parser.add_argument('--archive-dir', help='archive: 归档目录（默认 flask_backend/archive）')
+    parser.add_argument('--archive-format', choices=list(ARCHIVE_FORMATS), default='ndjson',
+                        help='archive: ndjson（gzip 压缩的 NDJSON）或 sqlite（可直接查询的归档库）')
+    parser.add_argument('--vacuum', choices=['incremental', 'full', 'none'], default='incremental',
+                        help='archive: 逐块 incremental_vacuum（默认）、结束后完整 VACUUM 或不回收空间')
+    parser.add_argument('--analysis-limit', type=int, default=1000, help='archive: ANALYZE 时每个索引最多扫描的行数')
+    args = parser.parse_args()
+    
+    if args.command == 'import':
+        if not args.path and not args.users:
+            parser.error('import 需要指定成绩文件或 --users')
+        if args.path and score_shards is not None:
+            parser.error('成绩分片模式下不支持 import，请先导入单库再按 user_id 拆分')
+        if args.users:
+            import_users(args.users, workers=args.workers)
+        if args.path:
+            import_scores(args.path, args.chunk_size or 50000, args.checkpoint)
+    elif args.command == 'migrate':
+        migrate_indexes()
+    elif args.command == 'backfill':
+        backfill_personal_bests()
+    elif args.command == 'rollup':
+        rebuild_period_tops()
+    elif args.command == 'reconcile':
+        reconcile_stats()
+    elif args.command == 'replicate':
+        replicate_database()
+    elif args.command == 'archive':
+        archive_scores(args.keep_top, args.keep_days, args.archive_dir, args.archive_format,
+                       args.chunk_size or 5000, args.vacuum, args.analysis_limit)
+    elif args.command == 'check':
+        check_query_plans()
+        check_leaderboard_engine()
+    else:
+        init_database()
\ No newline at end of file
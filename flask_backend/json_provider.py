@@ -0,0 +1,58 @@
+"""可替换的 JSON 序列化后端
+
+JSON_BACKEND 选择 jsonify 使用的序列化实现：
+- auto:   安装了 orjson 时使用 orjson，否则使用标准库（默认）
+- orjson: orjson，直接生成 UTF-8 字节，比标准库快一个数量级
+- stdlib: 标准库 json
+
+两种后端都不排序键、不转义非 ASCII 字符，datetime 输出为 ISO 8601 字符串，
+切换后端不改变响应内容的含义。
+"""
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖
+    orjson = None
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    sort_keys = False
+    ensure_ascii = False
+
+    @staticmethod
+    def default(o):
+        # Flask 默认把 datetime 输出为 HTTP 日期格式，这里与 orjson 保持一致使用 ISO 8601
+        if isinstance(o, date):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+class OrjsonProvider(StdlibJSONProvider):
+    option = orjson.OPT_NON_STR_KEYS if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # 直接用 orjson 生成的字节构造响应，省去一次 decode/encode
+        obj = self._prepare_response_obj(args, kwargs)
+        body = orjson.dumps(obj, default=self.default, option=self.option)
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+JSON_PROVIDERS = {
+    'stdlib': StdlibJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+def json_provider_class(name='auto'):
+    if name == 'auto':
+        name = 'orjson' if orjson else 'stdlib'
+    if name not in JSON_PROVIDERS:
+        raise ValueError(f'未知的 JSON 后端: {name}')
+    if name == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_BACKEND=orjson 需要先安装 orjson')
+    return JSON_PROVIDERS[name]
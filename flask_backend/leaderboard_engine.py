@@ -0,0 +1,243 @@
+"""内存排行榜引擎
+
+启动时从 Score 表加载一次，之后由 upload_score 增量更新。每个
+(level_type, level_number, difficulty) 桶维护一个按 (-score, completion_time, id)
+排序的分块有序列表，前 N 名和名次查询均为 O(log n)，排序规则与
+build_leaderboard_query 的 SQL 完全一致。
+"""
+from bisect import bisect_left, bisect_right, insort
+from heapq import merge
+from itertools import islice
+import threading
+
+class SortedKeyList:
+    """分块有序列表，用树状数组记录各块长度以支持按名次定位"""
+
+    LOAD = 512
+
+    def __init__(self):
+        self._chunks = []  # 有序子列表
+        self._maxes = []   # 每个子列表的最大键
+        self._tree = [0]   # 各子列表长度的树状数组（下标从 1 开始）
+        self._len = 0
+
+    @classmethod
+    def from_sorted(cls, keys):
+        """由已排序的键列表直接分块构建，O(n)"""
+        instance = cls()
+        instance._chunks = [keys[i:i + cls.LOAD] for i in range(0, len(keys), cls.LOAD)]
+        instance._maxes = [chunk[-1] for chunk in instance._chunks]
+        instance._len = len(keys)
+        instance._rebuild_tree()
+        return instance
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for chunk in self._chunks:
+            yield from chunk
+
+    def _rebuild_tree(self):
+        size = len(self._chunks)
+        tree = [0] * (size + 1)
+        for i in range(1, size + 1):
+            tree[i] += len(self._chunks[i - 1])
+            parent = i + (i & -i)
+            if parent <= size:
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _update_tree(self, index, delta):
+        i = index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, index):
+        """前 index 个子列表的元素总数"""
+        total = 0
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+    def _locate(self, position):
+        """返回第 position 个元素（从 0 开始）所在的 (子列表下标, 块内偏移)"""
+        index = 0
+        step = 1 << (len(self._chunks).bit_length())
+        while step:
+            nxt = index + step
+            if nxt < len(self._tree) and self._tree[nxt] <= position:
+                index = nxt
+                position -= self._tree[nxt]
+            step >>= 1
+        return index, position
+
+    def add(self, key):
+        if not self._chunks:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            self._rebuild_tree()
+            self._len = 1
+            return
+
+        i = bisect_left(self._maxes, key)
+        if i == len(self._chunks):
+            i -= 1
+        chunk = self._chunks[i]
+        insort(chunk, key)
+        self._maxes[i] = chunk[-1]
+        self._len += 1
+
+        if len(chunk) > 2 * self.LOAD:
+            self._chunks[i:i + 1] = [chunk[:self.LOAD], chunk[self.LOAD:]]
+            self._maxes[i:i + 1] = [chunk[self.LOAD - 1], chunk[-1]]
+            self._rebuild_tree()
+        else:
+            self._update_tree(i, 1)
+
+    def remove(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._chunks):
+            raise ValueError(f'{key!r} not in list')
+        chunk = self._chunks[i]
+        j = bisect_left(chunk, key)
+        if j == len(chunk) or chunk[j] != key:
+            raise ValueError(f'{key!r} not in list')
+
+        del chunk[j]
+        self._len -= 1
+        if chunk:
+            self._maxes[i] = chunk[-1]
+            self._update_tree(i, -1)
+        else:
+            del self._chunks[i]
+            del self._maxes[i]
+            self._rebuild_tree()
+
+    def bisect_left(self, key):
+        """严格小于 key 的元素个数"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._chunks):
+            return self._len
+        return self._prefix(i) + bisect_left(self._chunks[i], key)
+
+    def bisect_right(self, key):
+        """小于等于 key 的元素个数"""
+        i = bisect_right(self._maxes, key)
+        if i == len(self._chunks):
+            return self._len
+        return self._prefix(i) + bisect_right(self._chunks[i], key)
+
+    def islice(self, start=0, stop=None):
+        """按名次区间 [start, stop) 顺序迭代"""
+        if stop is None or stop > self._len:
+            stop = self._len
+        if start >= stop:
+            return
+        index, offset = self._locate(start)
+        remaining = stop - start
+        while remaining > 0:
+            piece = self._chunks[index][offset:offset + remaining]
+            yield from piece
+            remaining -= len(piece)
+            index += 1
+            offset = 0
+
+def score_key(row):
+    """排序键，与 ORDER BY score DESC, completion_time ASC, id ASC 一致"""
+    return (-row['score'], row['completion_time'], row['id'])
+
+def bucket_key(row):
+    return (row['level_type'], row['level_number'], row['difficulty'])
+
+class LeaderboardEngine:
+    """按 (level_type, level_number, difficulty) 分桶的内存排行榜"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._rows = {}
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    def load(self, rows):
+        """从成绩字典序列（score_row_to_dict 的结果）全量构建"""
+        buckets = {}
+        by_id = {}
+        for row in rows:
+            by_id[row['id']] = row
+            buckets.setdefault(bucket_key(row), []).append(score_key(row))
+
+        sorted_buckets = {key: SortedKeyList.from_sorted(sorted(keys)) for key, keys in buckets.items()}
+
+        with self._lock:
+            self._buckets = sorted_buckets
+            self._rows = by_id
+            self.loaded = True
+
+    def add(self, row):
+        with self._lock:
+            if row['id'] in self._rows:
+                return
+            self._rows[row['id']] = row
+            self._buckets.setdefault(bucket_key(row), SortedKeyList()).add(score_key(row))
+
+    def remove(self, score_id):
+        with self._lock:
+            row = self._rows.pop(score_id, None)
+            if row is None:
+                return
+            bucket = self._buckets[bucket_key(row)]
+            bucket.remove(score_key(row))
+            if not bucket:
+                del self._buckets[bucket_key(row)]
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _matching_buckets(self, level_type='all', level_number=None, difficulty=None):
+        # 过滤语义与 build_leaderboard_query 保持一致：level_number 为 0 时同样按关卡 0 过滤
+        number_filter = level_number is not None and level_number != ''
+        if number_filter:
+            level_number = int(level_number)
+        return [
+            bucket for (bucket_type, bucket_number, bucket_difficulty), bucket in self._buckets.items()
+            if (level_type == 'all' or bucket_type == level_type)
+            and (not number_filter or bucket_number == level_number)
+            and (not difficulty or bucket_difficulty == difficulty)
+        ]
+
+    def top(self, level_type='all', level_number=None, difficulty=None, limit=50, offset=0, after=None):
+        """返回排好序的成绩字典副本；limit 为负数时与 SQLite 一致返回全部。
+        after 为游标中的 (score, completion_time, id)，只返回排在其后的成绩
+        """
+        stop = None if limit < 0 else offset + limit
+        with self._lock:
+            buckets = self._matching_buckets(level_type, level_number, difficulty)
+            if after is not None:
+                key = (-after[0], after[1], after[2])
+                sources = [bucket.islice(bucket.bisect_right(key)) for bucket in buckets]
+            else:
+                sources = buckets
+            if len(buckets) == 1 and after is None:
+                keys = list(buckets[0].islice(offset, stop))
+            else:
+                keys = list(islice(merge(*sources), offset, stop))
+            return [dict(self._rows[key[2]]) for key in keys]
+
+    def count(self, level_type='all', level_number=None, difficulty=None):
+        with self._lock:
+            return sum(len(bucket) for bucket in self._matching_buckets(level_type, level_number, difficulty))
+
+    def rank_of(self, score_id, level_type='all', level_number=None, difficulty=None):
+        """返回成绩在给定过滤条件下的名次（从 1 开始）；不存在时返回 None"""
+        with self._lock:
+            row = self._rows.get(score_id)
+            if row is None:
+                return None
+            key = score_key(row)
+            buckets = self._matching_buckets(level_type, level_number, difficulty)
+            if self._buckets.get(bucket_key(row)) not in buckets:
+                return None
+            return sum(bucket.bisect_left(key) for bucket in buckets) + 1
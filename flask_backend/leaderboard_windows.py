@@ -0,0 +1,36 @@
+"""限时排行榜的周期划分
+
+每条成绩按上传时间（UTC）归入日、周、赛季三种周期。周期键是可按字典序比较的字符串：
+
+    day     2026-10-18
+    week    2026-W42   （ISO 周）
+    season  2026-Q4    （自然季度）
+
+同一种周期内键的字典序与时间先后一致，过期判断只需比较字符串。
+"""
+from datetime import timedelta
+
+WINDOWS = ('day', 'week', 'season')
+
+def period_key(window, when):
+    if window == 'day':
+        return when.strftime('%Y-%m-%d')
+    if window == 'week':
+        year, week, _ = when.isocalendar()
+        return f'{year}-W{week:02d}'
+    if window == 'season':
+        return f'{when.year}-Q{(when.month - 1) // 3 + 1}'
+    raise ValueError(f'未知的排行榜周期: {window}')
+
+def period_keys(when):
+    """一个时间点在每种周期下的键"""
+    return {window: period_key(window, when) for window in WINDOWS}
+
+def oldest_retained(window, now, retention):
+    """保留最近 retention 个周期（含当前周期）时最早的周期键，更早的周期已过期"""
+    if window == 'day':
+        return period_key(window, now - timedelta(days=retention - 1))
+    if window == 'week':
+        return period_key(window, now - timedelta(weeks=retention - 1))
+    quarter = now.year * 4 + (now.month - 1) // 3 - (retention - 1)
+    return f'{quarter // 4}-Q{quarter % 4 + 1}'
@@ -0,0 +1,62 @@
+"""密码哈希进程池
+
+PBKDF2 计算量很大。登录高峰时如果直接在请求线程中计算，所有服务线程都会被占满，
+连 /api/health 也会超时。这里把哈希和校验交给有界的 ProcessPoolExecutor，
+同时等待的请求数超过 max_pending 时抛出 HasherBusy，由接口返回 429。
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import threading
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+class HasherBusy(Exception):
+    """等待哈希的请求过多"""
+
+class PasswordHasher:
+    def __init__(self, workers=None, max_pending=None, method='pbkdf2:sha256:260000', salt_length=16):
+        self.workers = (os.cpu_count() or 1) if workers is None else workers  # 0 表示在调用线程中直接计算
+        self.max_pending = max_pending or max(self.workers, 1) * 4
+        self.method = method
+        self.salt_length = salt_length
+
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn：服务进程是多线程的，fork 可能复制到被其他线程持有的锁
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('等待计算密码哈希的请求过多')
+        try:
+            if self.workers == 0:
+                return func(*args)
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """已存储的哈希参数与当前配置不同（如迭代次数）时返回 True"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,408 @@
+"""成绩回放校验
+
+客户端上传成绩时可以附带一段回放：关卡几何（屏幕尺寸、小球、起点、终点、障碍物、陷阱）
+和按帧采样的加速度传感器读数。服务端用与 Ball.kt / GameView.kt 相同的单精度浮点步进
+重新推演小球轨迹，只有小球恰好在回放的最后一帧到达终点、且完成时间和分数与帧数相符时
+才接受这条成绩。
+
+回放格式（坐标单位为像素，与客户端 GameView 一致）：
+
+    {
+        "width": 1080, "height": 2200, "radius": 30,
+        "start": [x, y],
+        "goal": [left, top, right, bottom],
+        "obstacles": [[left, top, right, bottom], ...],
+        "traps": [[left, top, right, bottom], ...],
+        "frames": 5321,
+        "inputs": [[frame, sensor_x, sensor_y], ...]
+    }
+
+inputs 是传感器原始读数（event.values[0], event.values[1]），从第 0 帧开始、帧号严格递增，
+每个读数一直生效到下一个采样帧。frames 是从开始到获胜（含获胜那一帧）调用 update 的次数。
+
+推演用 NumPy 的 float32 数组按帧同步推进一批回放：每一帧的球体运动、出界、陷阱和终点
+判断都是整批的向量运算，障碍物碰撞先对整批做一次相交检测，只对真正碰撞的回放逐个处理。
+批量推演在 ProcessPoolExecutor 中进行，ReplayVerifier 把各请求线程提交的回放攒成批次
+再交给进程池，批次越大每条回放分摊的 Python 开销越小。
+
+REPLAY_CHECK 选择校验模式：
+- off:      不校验
+- optional: 只校验附带回放的成绩
+- required: 拒绝没有回放的成绩
+- auto:     安装了 numpy 时等同 optional，否则等同 off（默认）
+"""
+from concurrent.futures import Future, ProcessPoolExecutor
+import math
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+try:
+    import numpy as np
+except ImportError:  # numpy 是可选依赖，未安装时不能开启回放校验
+    np = None
+
+# 与 Ball.kt 一致的物理参数
+FRICTION = 0.99
+BOUNCE = 0.7
+MIN_SPEED_TO_STOP = 0.1
+MAX_SPEED = 35
+EPSILON = 0.0001
+# GameView.onSensorChanged 中传感器读数到加速度的换算系数
+SENSOR_SCALE = 0.1
+
+# 游戏循环每帧至少休眠 8ms；低端机掉帧时按最慢 20 FPS 估算上限
+MIN_FRAME_SECONDS = 0.008
+MAX_FRAME_SECONDS = 0.05
+# 完成时间在获胜后弹出对话框时才读取，且 currentTimeMillis 有毫秒级误差
+TIME_SLACK_SECONDS = 1.0
+
+MAX_FRAMES = 120 * 600
+MAX_RECTS = 4096
+MAX_SCREEN = 10000
+
+# 有固定计分规则的关卡类型：完成时间（秒） -> 分数，与客户端 calculateScore 一致
+SCORE_RULES = {
+    'challenge': lambda seconds: max(10000 - int(seconds) * 50, 1000),
+}
+
+RUNNING, WON, LOST = 0, 1, 2
+# 填充障碍物 / 陷阱数组用的远离屏幕的空矩形，不会与任何小球相交
+FAR_AWAY = -1e6
+
+REPLAY_CHECK_MODES = ('off', 'optional', 'required')
+
+class ReplayError(ValueError):
+    """回放数据格式错误"""
+
+class VerifierBusy(Exception):
+    """等待校验的回放过多"""
+
+def replay_check_mode(name='auto'):
+    if name == 'auto':
+        return 'optional' if np is not None else 'off'
+    if name not in REPLAY_CHECK_MODES:
+        raise ValueError(f'未知的回放校验模式: {name}')
+    if name != 'off' and np is None:
+        raise RuntimeError(f'REPLAY_CHECK={name} 需要先安装 numpy')
+    return name
+
+def _number(value, name):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ReplayError(f'{name} 必须是有限数值')
+    return float(value)
+
+def _rects(values, name):
+    if not isinstance(values, list) or len(values) > MAX_RECTS:
+        raise ReplayError(f'{name} 必须是不超过 {MAX_RECTS} 个矩形的列表')
+    rects = []
+    for rect in values:
+        if not isinstance(rect, list) or len(rect) != 4:
+            raise ReplayError(f'{name} 中的矩形必须是 [left, top, right, bottom]')
+        left, top, right, bottom = (_number(value, name) for value in rect)
+        if left > right or top > bottom:
+            raise ReplayError(f'{name} 中的矩形左上角必须在右下角之前')
+        rects.append((left, top, right, bottom))
+    return rects
+
+def parse_replay(replay):
+    """校验回放格式，返回可以交给工作进程的元组；格式错误时抛出 ReplayError"""
+    if not isinstance(replay, dict):
+        raise ReplayError('回放必须是对象')
+    try:
+        width, height, frames = replay['width'], replay['height'], replay['frames']
+        radius = _number(replay['radius'], 'radius')
+        start = replay['start']
+        goal = _rects([replay['goal']], 'goal')[0]
+        inputs = replay['inputs']
+    except KeyError as e:
+        raise ReplayError(f'缺少字段 {e.args[0]}') from None
+
+    for name, value, upper in (('width', width, MAX_SCREEN), ('height', height, MAX_SCREEN), ('frames', frames, MAX_FRAMES)):
+        if isinstance(value, bool) or not isinstance(value, int) or not 0 < value <= upper:
+            raise ReplayError(f'{name} 必须是 1 到 {upper} 之间的整数')
+    if radius <= 0:
+        raise ReplayError('radius 必须大于 0')
+    if not isinstance(start, list) or len(start) != 2:
+        raise ReplayError('start 必须是 [x, y]')
+    start = (_number(start[0], 'start'), _number(start[1], 'start'))
+
+    if not isinstance(inputs, list) or not inputs or len(inputs) > frames:
+        raise ReplayError('inputs 必须是非空列表且不超过帧数')
+    samples = []
+    for sample in inputs:
+        if not isinstance(sample, list) or len(sample) != 3 or isinstance(sample[0], bool) or not isinstance(sample[0], int):
+            raise ReplayError('inputs 中的采样必须是 [frame, sensor_x, sensor_y]')
+        previous = samples[-1][0] if samples else -1
+        if (not samples and sample[0] != 0) or not previous < sample[0] < frames:
+            raise ReplayError('inputs 的帧号必须从 0 开始严格递增且小于 frames')
+        samples.append((sample[0], _number(sample[1], 'inputs'), _number(sample[2], 'inputs')))
+
+    obstacles = _rects(replay.get('obstacles', []), 'obstacles')
+    traps = _rects(replay.get('traps', []), 'traps')
+    return (width, height, radius, start, goal, obstacles, traps, frames, samples)
+
+def _pad_rects(rect_lists):
+    """把每条回放的矩形列表填充成 [回放数, 最大矩形数] 的四个 float32 数组"""
+    width = max(max((len(rects) for rects in rect_lists), default=0), 1)
+    padded = np.full((len(rect_lists), width, 4), FAR_AWAY, dtype=np.float32)
+    for i, rects in enumerate(rect_lists):
+        if rects:
+            padded[i, :len(rects)] = rects
+    return padded[..., 0], padded[..., 1], padded[..., 2], padded[..., 3]
+
+def _overlaps(x, y, r2, left, top, right, bottom):
+    """Ball.checkCollision：矩形上离球心最近的点到球心的距离小于半径。
+    x - clamp(x, left, right) 与 max(left - x, x - right, 0) 只差符号，平方后完全相同
+    """
+    dx = np.maximum(np.maximum(left - x, x - right), 0)
+    dy = np.maximum(np.maximum(top - y, y - bottom), 0)
+    return dx * dx + dy * dy < r2
+
+def _handle_collision(x, y, vx, vy, radius, left, top, right, bottom):
+    """Ball.handleCollision，只对已经确认相交的回放调用（各参数均为一维 float32 数组）"""
+    one, zero = np.float32(1), np.float32(0)
+    dx = x - np.minimum(np.maximum(x, left), right)
+    dy = y - np.minimum(np.maximum(y, top), bottom)
+    distance = np.sqrt(dx * dx + dy * dy)
+    outside = distance > np.float32(EPSILON)
+
+    # 标准情况：球心在矩形外，沿最近点方向推出
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normal_x = dx / distance
+        normal_y = dy / distance
+    penetration = radius - distance
+
+    # 特殊情况：球心在矩形内，沿重叠较小的轴推出
+    center_x = (left + right) / 2
+    center_y = (top + bottom) / 2
+    overlap_x = (radius + (right - left) / 2) - np.abs(x - center_x)
+    overlap_y = (radius + (bottom - top) / 2) - np.abs(y - center_y)
+    along_x = overlap_x < overlap_y
+    normal_x = np.where(outside, normal_x, np.where(along_x, np.where(x < center_x, one, -one), zero))
+    normal_y = np.where(outside, normal_y, np.where(along_x, zero, np.where(y < center_y, one, -one)))
+    penetration = np.where(outside, penetration, np.maximum(np.where(along_x, overlap_x, overlap_y), zero))
+
+    pushed = penetration > 0
+    offset = penetration + np.float32(0.1)
+    x = np.where(pushed, x + normal_x * offset, x)
+    y = np.where(pushed, y + normal_y * offset, y)
+    dot = vx * normal_x + vy * normal_y
+    reflect = pushed & (dot < 0)
+    vx = np.where(reflect, vx - 2 * dot * normal_x * np.float32(BOUNCE), vx)
+    vy = np.where(reflect, vy - 2 * dot * normal_y * np.float32(BOUNCE), vy)
+    return x, y, vx, vy
+
+def simulate(replays):
+    """按帧同步推演一批已解析的回放，返回每条回放的 (结果, 结束帧号)；未结束的帧号为 -1"""
+    f32 = np.float32
+    count = len(replays)
+    rows = np.arange(count)
+    width = np.array([replay[0] for replay in replays], dtype=f32)
+    height = np.array([replay[1] for replay in replays], dtype=f32)
+    radius = np.array([replay[2] for replay in replays], dtype=f32)
+    r2 = radius * radius
+    x = np.array([replay[3][0] for replay in replays], dtype=f32)
+    y = np.array([replay[3][1] for replay in replays], dtype=f32)
+    vx = np.zeros(count, dtype=f32)  # Ball.reset 把速度清零
+    vy = np.zeros(count, dtype=f32)
+    goal = np.array([replay[4] for replay in replays], dtype=f32).T
+    obstacles = _pad_rects([replay[5] for replay in replays])
+    obstacle_index = np.arange(obstacles[0].shape[1])
+    traps = _pad_rects([replay[6] for replay in replays])
+    frames = np.array([replay[7] for replay in replays])
+
+    # 采样表末尾放一个永远到不了的帧号，指针不会越界
+    samples = max(len(replay[8]) for replay in replays)
+    sample_frames = np.full((count, samples + 1), MAX_FRAMES + 1, dtype=np.int64)
+    sample_ax = np.zeros((count, samples), dtype=f32)
+    sample_ay = np.zeros((count, samples), dtype=f32)
+    for i, replay in enumerate(replays):
+        values = np.array(replay[8], dtype=np.float64)
+        sample_frames[i, :len(values)] = values[:, 0]
+        # 与 onSensorChanged 相同：-values[0] * 0.1f, values[1] * 0.1f
+        sample_ax[i, :len(values)] = -values[:, 1].astype(f32) * f32(SENSOR_SCALE)
+        sample_ay[i, :len(values)] = values[:, 2].astype(f32) * f32(SENSOR_SCALE)
+    pointer = np.zeros(count, dtype=np.int64)
+
+    outcome = np.full(count, RUNNING, dtype=np.int8)
+    end_frame = np.full(count, -1, dtype=np.int64)
+    active = np.ones(count, dtype=bool)
+
+    for frame in range(int(frames.max())):
+        active &= frame < frames
+        if not active.any():
+            break
+        pointer += sample_frames[rows, pointer + 1] == frame
+        ax = sample_ax[rows, pointer]
+        ay = sample_ay[rows, pointer]
+
+        # Ball.update：加速度、摩擦、限速
+        vx = (vx + ax) * f32(FRICTION)
+        vy = (vy + ay) * f32(FRICTION)
+        speed = np.sqrt(vx * vx + vy * vy)
+        too_fast = speed > f32(MAX_SPEED)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = f32(MAX_SPEED) / speed
+        vx = np.where(too_fast, vx * scale, vx)
+        vy = np.where(too_fast, vy * scale, vy)
+
+        # 屏幕边界反弹
+        next_x = x + vx
+        next_y = y + vy
+        hit_left = next_x - radius < 0
+        hit_right = ~hit_left & (next_x + radius > width)
+        x = np.where(hit_left, radius, np.where(hit_right, width - radius, next_x))
+        vx = np.where(hit_left | hit_right, -vx * f32(BOUNCE), vx)
+        hit_top = next_y - radius < 0
+        hit_bottom = ~hit_top & (next_y + radius > height)
+        y = np.where(hit_top, radius, np.where(hit_bottom, height - radius, next_y))
+        vy = np.where(hit_top | hit_bottom, -vy * f32(BOUNCE), vy)
+
+        vx = np.where((np.abs(vx) < f32(MIN_SPEED_TO_STOP)) & (np.abs(ax) < f32(EPSILON)), f32(0), vx)
+        vy = np.where((np.abs(vy) < f32(MIN_SPEED_TO_STOP)) & (np.abs(ay) < f32(EPSILON)), f32(0), vy)
+
+        # GameView.updateGame：贴边即判负
+        out = (x - radius <= 0) | (x + radius >= width) | (y - radius <= 0) | (y + radius >= height)
+        alive = active & ~out
+
+        # 按顺序处理障碍物：每轮找出每条回放在上次处理的障碍物之后第一个相交的障碍物，
+        # 推出后再从下一个障碍物继续检测，与客户端逐个 checkCollision / handleCollision 等价
+        last = np.full(count, -1, dtype=np.int64)
+        pending = alive
+        while True:
+            hits = _overlaps(x[:, None], y[:, None], r2[:, None], *obstacles) & (obstacle_index > last[:, None]) & pending[:, None]
+            colliding = np.flatnonzero(hits.any(axis=1))
+            if colliding.size == 0:
+                break
+            index = hits[colliding].argmax(axis=1)
+            rects = (rect[colliding, index] for rect in obstacles)
+            x[colliding], y[colliding], vx[colliding], vy[colliding] = _handle_collision(
+                x[colliding], y[colliding], vx[colliding], vy[colliding], radius[colliding], *rects)
+            last[colliding] = index
+            pending = np.zeros(count, dtype=bool)
+            pending[colliding] = True
+
+        trapped = alive & _overlaps(x[:, None], y[:, None], r2[:, None], *traps).any(axis=1)
+        won = alive & ~trapped & (x > goal[0]) & (x < goal[2]) & (y > goal[1]) & (y < goal[3])
+        lost = active & (out | trapped)
+
+        outcome[won] = WON
+        outcome[lost] = LOST
+        end_frame[won | lost] = frame
+        active &= ~(won | lost)
+
+    return list(zip(outcome.tolist(), end_frame.tolist()))
+
+def check_batch(items):
+    """在工作进程中校验一批 (回放, 完成时间, 分数, 关卡类型)，返回每条的问题描述，通过时为 None"""
+    problems = []
+    for (replay, completion_time, score, level_type), (outcome, end_frame) in zip(items, simulate([item[0] for item in items])):
+        frames = replay[7]
+        if outcome == LOST:
+            problems.append(f'小球在第 {end_frame + 1} 帧出界或碰到陷阱')
+        elif outcome == RUNNING:
+            problems.append(f'{frames} 帧内小球没有到达终点')
+        elif end_frame != frames - 1:
+            problems.append(f'小球在第 {end_frame + 1} 帧到达终点，与回放的 {frames} 帧不符')
+        elif not frames * MIN_FRAME_SECONDS - TIME_SLACK_SECONDS <= completion_time <= frames * MAX_FRAME_SECONDS + TIME_SLACK_SECONDS:
+            problems.append(f'完成时间 {completion_time} 秒与回放的 {frames} 帧不符')
+        elif level_type in SCORE_RULES and score != SCORE_RULES[level_type](completion_time):
+            problems.append(f'分数应为 {SCORE_RULES[level_type](completion_time)}')
+        else:
+            problems.append(None)
+    return problems
+
+class ReplayVerifier:
+    """把请求线程提交的回放攒批后交给进程池推演
+
+    分派线程取到第一条回放后最多再等 batch_window 秒或攒满 batch_size 条，整批提交给进程池；
+    同时等待的回放数超过 max_pending 时抛出 VerifierBusy，由接口返回 429。
+    """
+
+    def __init__(self, workers=None, max_pending=None, batch_size=64, batch_window=0.005):
+        if np is None:
+            raise RuntimeError('回放校验需要先安装 numpy')
+        self.workers = (os.cpu_count() or 1) if workers is None else workers  # 0 表示在调用线程中直接推演
+        self.max_pending = max_pending or max(self.workers, 1) * batch_size * 4
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+
+        self._pending = 0
+        self._queue = queue.Queue()
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn：服务进程是多线程的，fork 可能复制到被其他线程持有的锁
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                threading.Thread(target=self._dispatch, args=(self._executor,), name='replay-dispatch', daemon=True).start()
+            return self._executor
+
+    def _dispatch(self, executor):
+        while True:
+            batch = [self._queue.get()]
+            if batch[0] is None:
+                return
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)  # 先把已取出的批次提交完再退出
+                    break
+                batch.append(item)
+            try:
+                future = executor.submit(check_batch, [item for item, _ in batch])
+            except RuntimeError as e:  # 进程池已关闭
+                for _, waiter in batch:
+                    waiter.set_exception(e)
+                continue
+            future.add_done_callback(lambda future, batch=batch: self._resolve(future, batch))
+
+    @staticmethod
+    def _resolve(future, batch):
+        try:
+            problems = future.result()
+        except Exception as e:
+            for _, waiter in batch:
+                waiter.set_exception(e)
+            return
+        for (_, waiter), problem in zip(batch, problems):
+            waiter.set_result(problem)
+
+    def verify_many(self, items):
+        """校验多条 (parse_replay 的结果, 完成时间, 分数, 关卡类型)，返回每条的问题描述，通过时为 None"""
+        with self._lock:
+            if self._pending + len(items) > self.max_pending:
+                raise VerifierBusy('等待校验的回放过多')
+            self._pending += len(items)
+        try:
+            if self.workers == 0:
+                return check_batch(items)
+            self._get_executor()
+            waiters = []
+            for item in items:
+                waiter = Future()
+                self._queue.put((item, waiter))
+                waiters.append(waiter)
+            return [waiter.result() for waiter in waiters]
+        finally:
+            with self._lock:
+                self._pending -= len(items)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._queue.put(None)
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,159 @@
+"""请求计时与 SQL 统计
+
+每个请求记录耗时、执行的 SQL 语句数和累计数据库耗时，按路由汇总为直方图，
+由 /api/metrics 以 Prometheus 文本格式导出。SQL 耗时通过 SQLAlchemy 的
+before_cursor_execute / after_cursor_execute 事件测量。
+
+超过阈值的慢请求和慢查询写入日志（慢查询带 SQL 文本）。指标保存在进程内，
+多进程部署时每个 worker 各自统计。
+"""
+from bisect import bisect_left
+from collections import defaultdict
+import logging
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Prometheus 风格的累积直方图（上界 le 包含等于）"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # 最后一格为 +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        """(le, 累计次数) 序列，最后一项为 +Inf"""
+        total = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            total += count
+            yield bound, total
+
+class RequestMetrics:
+    def __init__(self, slow_request_ms=500, slow_query_ms=100):
+        self.slow_request = slow_request_ms / 1000
+        self.slow_query = slow_query_ms / 1000
+        self._lock = threading.Lock()
+        self._latency = defaultdict(lambda: Histogram(LATENCY_BUCKETS))  # (method, route) -> 耗时
+        self._statements = defaultdict(lambda: Histogram(STATEMENT_BUCKETS))  # (method, route) -> 每请求语句数
+        self._db_seconds = defaultdict(float)  # (method, route) -> 累计数据库耗时
+        self._responses = defaultdict(int)  # (method, route, status) -> 次数
+        self._sql_count = 0
+        self._sql_seconds = 0.0
+
+    def install(self, app, engines):
+        """注册请求钩子和 SQL 事件"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    def _before_request(self):
+        g.metrics_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+
+    def _after_request(self, response):
+        if 'metrics_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.metrics_start
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        key = (request.method, route)
+        with self._lock:
+            self._latency[key].observe(elapsed)
+            self._statements[key].observe(g.sql_count)
+            self._db_seconds[key] += g.sql_seconds
+            self._responses[(*key, response.status_code)] += 1
+        if elapsed >= self.slow_request:
+            logger.warning('慢请求 %s %s: %.1f ms，%d 条 SQL 共 %.1f ms', request.method, request.full_path,
+                           elapsed * 1000, g.sql_count, g.sql_seconds * 1000)
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # 开始时间记在本条语句的执行上下文上：语句出错时 after_cursor_execute 不会执行，
+        # 记在连接上会遗留在连接池的连接中
+        if context is not None:
+            context._query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_query_start', None)
+        if start is None:
+            return
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._sql_count += 1
+            self._sql_seconds += elapsed
+        # 后台写入线程等没有请求上下文的语句只计入全局统计
+        if has_request_context() and 'sql_count' in g:
+            g.sql_count += 1
+            g.sql_seconds += elapsed
+        if elapsed >= self.slow_query:
+            logger.warning('慢查询 %.1f ms: %s', elapsed * 1000, ' '.join(statement.split()))
+
+    def render(self):
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        with self._lock:
+            lines += [
+                '# HELP http_request_duration_seconds 请求耗时',
+                '# TYPE http_request_duration_seconds histogram',
+            ]
+            for key, histogram in sorted(self._latency.items()):
+                lines += _histogram_lines('http_request_duration_seconds', _labels(key), histogram)
+
+            lines += [
+                '# HELP http_request_sql_statements 每个请求执行的 SQL 语句数',
+                '# TYPE http_request_sql_statements histogram',
+            ]
+            for key, histogram in sorted(self._statements.items()):
+                lines += _histogram_lines('http_request_sql_statements', _labels(key), histogram)
+
+            lines += [
+                '# HELP http_request_db_seconds_total 请求中执行 SQL 的累计耗时',
+                '# TYPE http_request_db_seconds_total counter',
+            ]
+            lines += [f'http_request_db_seconds_total{{{_labels(key)}}} {value}' for key, value in sorted(self._db_seconds.items())]
+
+            lines += [
+                '# HELP http_responses_total 按状态码统计的响应数',
+                '# TYPE http_responses_total counter',
+            ]
+            lines += [
+                f'http_responses_total{{{_labels((method, route))},status="{status}"}} {count}'
+                for (method, route, status), count in sorted(self._responses.items())
+            ]
+
+            lines += [
+                '# HELP sql_statements_total 执行的 SQL 语句总数（含后台线程）',
+                '# TYPE sql_statements_total counter',
+                f'sql_statements_total {self._sql_count}',
+                '# HELP sql_duration_seconds_total SQL 累计耗时（含后台线程）',
+                '# TYPE sql_duration_seconds_total counter',
+                f'sql_duration_seconds_total {self._sql_seconds}',
+            ]
+        return '\n'.join(lines) + '\n'
+
+def _labels(key):
+    method, route = key
+    return f'method="{method}",route="{_escape(route)}"'
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+def _histogram_lines(name, labels, histogram):
+    for bound, count in histogram.samples():
+        yield f'{name}_bucket{{{labels},le="{bound}"}} {count}'
+    yield f'{name}_sum{{{labels}}} {histogram.sum}'
+    yield f'{name}_count{{{labels}}} {sum(histogram.counts)}'
@@ -0,0 +1,52 @@
+"""JSON 响应压缩
+
+按请求的 Accept-Encoding 协商内容编码：安装了 brotli 时优先 br，否则 gzip。
+只压缩超过 min_size 字节的 JSON 响应，小响应压缩后反而可能变大，也不值得花 CPU。
+流式响应（成绩导出）逐块发送，不在这里压缩。
+
+压缩后的响应改用弱 ETag：不同编码的字节不同但内容相同，If-None-Match 本来就按弱比较，
+客户端带着弱 ETag 重新验证时仍然能得到 304。
+"""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli 是可选依赖，未安装时只提供 gzip
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {'application/json'}
+
+class ResponseCompressor:
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5):
+        self.min_size = min_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ('br', 'gzip') if brotli else ('gzip',)
+
+    def install(self, app):
+        app.after_request(self._after_request)
+
+    def compress(self, data, encoding):
+        if encoding == 'br':
+            return brotli.compress(data, quality=self.brotli_quality)
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def _after_request(self, response):
+        if (response.status_code != 200 or response.is_streamed or response.direct_passthrough
+                or response.mimetype not in COMPRESSIBLE_MIMETYPES or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.content_length is not None and response.content_length < self.min_size:
+            return response
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+
+        response.set_data(self.compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
@@ -0,0 +1,40 @@
+"""成绩导出的流式序列化
+
+导出接口把查询结果逐行交给这里的生成器，每次只产出一行文本，配合 Flask 的
+生成器 Response 以分块传输发送，内存占用与导出的行数无关。
+"""
+import csv
+import io
+import json
+
+# 导出格式 -> Content-Type
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+def ndjson_lines(rows):
+    """每个成绩字典输出为一行 JSON"""
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+def csv_lines(rows, columns):
+    """先输出表头，再逐行输出；复用同一个缓冲区，不累积已输出的内容"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def take(values):
+        writer.writerow(values)
+        line = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return line
+
+    yield take(columns)
+    for row in rows:
+        yield take([row[column] for column in columns])
+
+def export_lines(fmt, rows, columns):
+    if fmt == 'csv':
+        return csv_lines(rows, columns)
+    return ndjson_lines(rows)
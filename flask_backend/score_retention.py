@@ -0,0 +1,138 @@
+"""成绩保留、归档与压缩
+
+score 表只增不减，表和索引越来越大，全表扫描类的查询逐月变慢。归档任务（init_db.py archive）在热表中保留：
+
+- 每个玩家在每个 (level_type, level_number, difficulty) 桶中排名最靠前的 keep_top 条成绩
+- 最近 keep_days 天内上传的全部成绩
+- 个人最佳表和周期榜引用的成绩
+
+其余成绩按 id 顺序分块读出，按上传月份写入归档文件，归档落盘后再从热表删除，每块一个事务，
+中断后重新运行即可继续。归档格式：
+
+- ndjson: archive/scores-YYYY-MM.ndjson.gz，每块追加一个 gzip member（串联的 member 仍是合法的 gzip 文件），
+  字段与 /api/export/scores 相同，可用 init_db.py import 导回。中断重跑时同一块可能重复写入，导入时按 id 去重
+- sqlite: archive/scores-YYYY-MM.db，以 id 为主键 INSERT OR IGNORE，可直接查询，重复写入不产生重复行
+
+删除产生的空闲页通过 auto_vacuum=INCREMENTAL 的 PRAGMA incremental_vacuum 逐块归还给文件系统，
+每次只持有很短的写锁，不需要长时间锁库的完整 VACUUM。
+"""
+from heapq import heappush, heappushpop
+import gzip
+import os
+import sqlite3
+
+from score_export import ndjson_lines
+
+# 归档文件中的列，与 /api/export/scores 的输出一致
+ARCHIVE_COLUMNS = ('id', 'user_id', 'username', 'level_type', 'level_number', 'completion_time', 'score', 'difficulty', 'created_at')
+
+def retained_ids(rows, keep_top, cutoff, pinned=()):
+    """扫描全部成绩，返回应留在热表中的成绩 ID 集合。
+    每个 (玩家, 桶) 用大小为 keep_top 的小顶堆保留排名最靠前的成绩，堆顶是其中排名最低的一条
+    """
+    keep = set(pinned)
+    heaps = {}
+    for row in rows:
+        if row.created_at is None or row.created_at >= cutoff:
+            keep.add(row.id)
+        if keep_top <= 0:
+            continue
+        heap = heaps.setdefault((row.user_id, row.level_type, row.level_number, row.difficulty), [])
+        entry = ((row.score, -row.completion_time, -row.id), row.id)
+        if len(heap) < keep_top:
+            heappush(heap, entry)
+        elif entry[0] > heap[0][0]:
+            heappushpop(heap, entry)
+
+    for heap in heaps.values():
+        keep.update(score_id for _, score_id in heap)
+    return keep
+
+def archive_partition(score_dict):
+    """按上传月份分区，created_at 为 ISO 格式字符串"""
+    return score_dict['created_at'][:7]
+
+class NdjsonArchive:
+    def __init__(self, directory, compresslevel=6):
+        self.directory = directory
+        self.compresslevel = compresslevel
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, partition):
+        return os.path.join(self.directory, f'scores-{partition}.ndjson.gz')
+
+    def write(self, partition, score_dicts):
+        data = gzip.compress(''.join(ndjson_lines(score_dicts)).encode('utf-8'), compresslevel=self.compresslevel)
+        with open(self.path(partition), 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+class SqliteArchive:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, partition):
+        return os.path.join(self.directory, f'scores-{partition}.db')
+
+    def write(self, partition, score_dicts):
+        conn = sqlite3.connect(self.path(partition))
+        try:
+            with conn:
+                conn.execute(
+                    'CREATE TABLE IF NOT EXISTS score (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, username TEXT, '
+                    'level_type TEXT NOT NULL, level_number INTEGER, completion_time REAL NOT NULL, score INTEGER NOT NULL, '
+                    'difficulty TEXT, created_at TEXT)'
+                )
+                conn.executemany(
+                    f"INSERT OR IGNORE INTO score VALUES ({', '.join('?' * len(ARCHIVE_COLUMNS))})",
+                    [[score_dict[column] for column in ARCHIVE_COLUMNS] for score_dict in score_dicts]
+                )
+        finally:
+            conn.close()
+
+ARCHIVE_FORMATS = {
+    'ndjson': NdjsonArchive,
+    'sqlite': SqliteArchive,
+}
+
+def write_archive(archive, score_dicts):
+    """按月份分组写入归档，返回涉及的归档文件路径"""
+    partitions = {}
+    for score_dict in score_dicts:
+        partitions.setdefault(archive_partition(score_dict), []).append(score_dict)
+    for partition, group in partitions.items():
+        archive.write(partition, group)
+    return {archive.path(partition) for partition in partitions}
+
+def storage_stats(engine):
+    """返回 (数据库页总字节数, 其中空闲页字节数)"""
+    with engine.connect() as conn:
+        page_size = conn.exec_driver_sql('PRAGMA page_size').scalar()
+        page_count = conn.exec_driver_sql('PRAGMA page_count').scalar()
+        freelist = conn.exec_driver_sql('PRAGMA freelist_count').scalar()
+    return page_count * page_size, freelist * page_size
+
+def enable_incremental_vacuum(engine):
+    """把 auto_vacuum 切换为 INCREMENTAL；已有数据库需要一次完整 VACUUM 才生效，返回是否执行了 VACUUM"""
+    with engine.connect() as conn:
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() == 2:
+            return False
+        conn.exec_driver_sql('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.exec_driver_sql('VACUUM')
+    return True
+
+def reclaim_free_pages(engine):
+    """把空闲页归还给文件系统；WAL 模式下检查点之后文件才会截短"""
+    with engine.connect() as conn:
+        # incremental_vacuum 每执行一步释放一页，execute 只执行第一步，executescript 才会执行到结束
+        conn.connection.executescript('PRAGMA incremental_vacuum')
+        if conn.exec_driver_sql('PRAGMA journal_mode').scalar() == 'wal':
+            conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+
+def analyze_scores(engine, table_name, analysis_limit):
+    """只分析 score 表；analysis_limit 限制每个索引扫描的行数，统计信息为近似值但耗时与表大小无关"""
+    with engine.connect() as conn:
+        conn.exec_driver_sql(f'PRAGMA analysis_limit = {int(analysis_limit)}')
+        conn.exec_driver_sql(f'ANALYZE "{table_name}"')
@@ -0,0 +1,98 @@
+"""成绩表按 user_id 水平分片
+
+SCORE_SHARDS 配置多个 SQLite 文件后，成绩行按 user_id 取模写入其中一个分片，
+用户、个人最佳、周期榜和计数器仍保存在主库。每个分片有完整的 score 表结构和排行榜索引：
+
+- 个人成绩历史、玩家最佳成绩只涉及一个分片
+- 全局排行榜把同一条件下的前 N 名查询并行发往所有分片（scatter），再按排行榜排序
+  规则归并各分片已排好序的结果（gather），取前 N 名
+- 计数类查询在各分片上分别执行后求和
+
+成绩 ID 在所有分片间唯一：第 k 个分片（从 0 开始）只分配 id ≡ k + 1 (mod 分片数)，
+新 ID 由 INSERT 语句内的 MAX(id) 子查询得到，在 SQLite 写锁内完成，不会与并发写入冲突。
+成绩行在分片中单独提交，与主库的个人最佳等汇总表不在同一个事务中。
+"""
+from concurrent.futures import ThreadPoolExecutor
+import heapq
+from itertools import islice
+
+from sqlalchemy import Column, Integer, MetaData, Table, func, select
+
+class ScoreShards:
+    def __init__(self, score_table, engines):
+        self.engines = list(engines)
+        self.count = len(self.engines)
+
+        # 分片库中没有用户表：只声明主键供外键解析，建表时只创建 score 表
+        metadata = MetaData()
+        Table('user', metadata, Column('id', Integer, primary_key=True))
+        self.table = score_table.to_metadata(metadata)
+        self._executor = ThreadPoolExecutor(max_workers=self.count, thread_name_prefix='score-shard')
+
+    def create_all(self):
+        """在每个分片上补建 score 表及其索引"""
+        for engine in self.engines:
+            self.table.create(engine, checkfirst=True)
+            for index in self.table.indexes:
+                index.create(engine, checkfirst=True)
+
+    def drop_all(self):
+        for engine in self.engines:
+            self.table.drop(engine, checkfirst=True)
+
+    def shard_of(self, user_id):
+        return int(user_id) % self.count
+
+    def engine_for(self, user_id):
+        return self.engines[self.shard_of(user_id)]
+
+    def insert(self, rows):
+        """写入一组成绩行（列名 -> 值，不含 id），按分片分组并行提交，返回与 rows 对应的 ID"""
+        groups = {}
+        for i, row in enumerate(rows):
+            groups.setdefault(self.shard_of(row['user_id']), []).append(i)
+
+        def insert_group(shard, indexes):
+            next_id = select(func.coalesce(func.max(self.table.c.id), shard + 1 - self.count) + self.count).scalar_subquery()
+            statement = self.table.insert().values(id=next_id)
+            with self.engines[shard].begin() as conn:
+                return [conn.execute(statement, rows[i]).lastrowid for i in indexes]
+
+        ids = [None] * len(rows)
+        futures = {shard: self._executor.submit(insert_group, shard, indexes) for shard, indexes in groups.items()}
+        for shard, future in futures.items():
+            for i, score_id in zip(groups[shard], future.result()):
+                ids[i] = score_id
+        return ids
+
+    def _fetch(self, engine, statement):
+        with engine.connect() as conn:
+            return conn.execute(statement).all()
+
+    def fetch(self, user_id, statement):
+        """只在 user_id 所在的分片上执行查询"""
+        return self._fetch(self.engine_for(user_id), statement)
+
+    def scatter(self, statement):
+        """在所有分片上并行执行同一条查询，返回每个分片的结果行列表"""
+        return list(self._executor.map(lambda engine: self._fetch(engine, statement), self.engines))
+
+    def top(self, statement, limit, key):
+        """statement 须已按 key 排序并带 LIMIT；归并各分片结果后取前 limit 行（limit 为负数时不限制）"""
+        return list(islice(heapq.merge(*self.scatter(statement), key=key), limit if limit >= 0 else None))
+
+    def count_rows(self, statement):
+        """statement 为返回单个计数的查询，返回各分片结果之和"""
+        return sum(rows[0][0] for rows in self.scatter(statement))
+
+    def stream(self, statement, key, yield_per=1000):
+        """按 key 归并所有分片的流式查询结果（statement 须已按 key 排序），任意时刻每个分片只缓存一批行"""
+        def rows(engine):
+            with engine.connect() as conn:
+                result = conn.execution_options(stream_results=True, yield_per=yield_per).execute(statement)
+                yield from result
+
+        return heapq.merge(*(rows(engine) for engine in self.engines), key=key)
+
+    def shutdown(self):
+        self._executor.shutdown()
@@ -0,0 +1,90 @@
+"""无状态会话令牌
+
+login / register 用 SECRET_KEY 签发带时间戳的令牌（itsdangerous），之后的成绩上传和个人数据读取
+只需校验签名（微秒级），不再重复计算密码哈希。注销的令牌记录在吊销表中，直到其自然过期：
+
+- MemoryRevocations: 进程内字典，只适用于单进程部署
+- TableRevocations: 数据库中的 revoked_token 表，多个 worker 共享；校验时按主键查询一次，
+  已确认注销的令牌 ID 缓存在进程内（注销不可撤回，缓存不会过时）
+"""
+import threading
+import time
+import uuid
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+class TokenError(Exception):
+    """令牌无效、过期或已注销"""
+
+class MemoryRevocations:
+    def __init__(self):
+        self._revoked = {}  # 令牌ID -> 自然过期时间
+        self._lock = threading.Lock()
+
+    def contains(self, sid):
+        with self._lock:
+            return sid in self._revoked
+
+    def add(self, sid, expires_at):
+        now = time.time()
+        with self._lock:
+            # 顺便清理已自然过期、不再需要记录的令牌
+            for expired in [key for key, expires in self._revoked.items() if expires <= now]:
+                del self._revoked[expired]
+            self._revoked[sid] = expires_at
+
+class TableRevocations:
+    """table 须有 sid（主键）和 expires_at（Unix 时间戳）两列；get_engine 在使用时返回主库引擎，读副本可能落后，不用于校验"""
+
+    def __init__(self, table, get_engine):
+        self.table = table
+        self.get_engine = get_engine
+        self._known = MemoryRevocations()
+
+    def contains(self, sid):
+        if self._known.contains(sid):
+            return True
+        with self.get_engine().connect() as conn:
+            expires_at = conn.execute(select(self.table.c.expires_at).where(self.table.c.sid == sid)).scalar()
+        if expires_at is None:
+            return False
+        self._known.add(sid, expires_at)
+        return True
+
+    def add(self, sid, expires_at):
+        with self.get_engine().begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.expires_at <= time.time()))
+            conn.execute(sqlite_insert(self.table).on_conflict_do_nothing(), {'sid': sid, 'expires_at': expires_at})
+        self._known.add(sid, expires_at)
+
+class SessionTokens:
+    def __init__(self, secret_key, max_age, revocations=None):
+        self.max_age = max_age
+        self._serializer = URLSafeTimedSerializer(secret_key, salt='session-token')
+        self._revocations = revocations if revocations is not None else MemoryRevocations()
+
+    def issue(self, user_id):
+        return self._serializer.dumps({'uid': user_id, 'sid': uuid.uuid4().hex})
+
+    def _load(self, token):
+        try:
+            payload, issued_at = self._serializer.loads(token, max_age=self.max_age, return_timestamp=True)
+        except SignatureExpired:
+            raise TokenError('令牌已过期')
+        except BadSignature:
+            raise TokenError('令牌无效')
+        return payload, issued_at.timestamp()
+
+    def verify(self, token):
+        """返回令牌对应的用户ID"""
+        payload, _ = self._load(token)
+        if self._revocations.contains(payload['sid']):
+            raise TokenError('令牌已注销')
+        return payload['uid']
+
+    def revoke(self, token):
+        payload, issued_at = self._load(token)
+        self._revocations.add(payload['sid'], issued_at + self.max_age)
+        return payload['uid']
@@ -0,0 +1,188 @@
+"""成绩异步写入队列（write-behind）
+
+上传接口把通过校验的成绩放入有界内存队列后立即返回，由一个后台写入线程按条数或时间
+分组，每组只提交一次事务。队列满时 submit 抛出 QueueFull，由接口返回 503。
+
+持久性（durability）：
+- none:  只在内存中排队，进程崩溃会丢失未写入的成绩
+- flush: 先追加写入日志文件并 flush，进程崩溃后重启可重放
+- fsync: 在 flush 基础上每条 fsync，可抵御系统崩溃
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DURABILITY_LEVELS = ('none', 'flush', 'fsync')
+
+class QueueFull(Exception):
+    """队列已满或正在关闭"""
+
+class WriteBehindQueue:
+    def __init__(self, commit, maxsize=10000, batch_size=200, flush_interval=0.05,
+                 durability='none', journal_path=None, max_retries=3):
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError(f'未知的持久性级别: {durability}')
+        if durability != 'none' and not journal_path:
+            raise ValueError('持久性级别为 flush/fsync 时必须指定日志文件')
+
+        self._commit = commit  # 回调：在一个事务中写入一组 item
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.durability = durability
+        self.journal_path = journal_path if durability != 'none' else None
+        self.max_retries = max_retries
+
+        self._journal = None
+        self._journal_lock = threading.Lock()
+        self._failed = {}  # 重试耗尽的成绩 ticket -> item，压缩日志时保留，重启时重放
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """重放日志中未提交的成绩并启动写入线程"""
+        if self.journal_path:
+            pending = self._replay_journal()
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+            for ticket, item in pending:
+                self._write_journal({'ticket': ticket, 'item': item})
+                self._queue.put((ticket, item))
+            if pending:
+                logger.info('从日志恢复 %d 条未写入的成绩', len(pending))
+
+        self._thread = threading.Thread(target=self._run, name='score-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, item):
+        """放入队列并返回 ticket；队列满时抛出 QueueFull"""
+        if self._stopping.is_set():
+            raise QueueFull('写入队列正在关闭')
+
+        ticket = uuid.uuid4().hex
+        with self._journal_lock:
+            try:
+                self._queue.put_nowait((ticket, item))
+            except queue.Full:
+                raise QueueFull('写入队列已满')
+            if self._journal:
+                self._write_journal({'ticket': ticket, 'item': item})
+        return ticket
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def flush(self):
+        """阻塞直到已提交的成绩全部写入数据库"""
+        self._queue.join()
+
+    def stop(self, timeout=None):
+        """停止接收新成绩，写完队列中剩余的成绩后退出"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+        if self._journal:
+            self._journal.close()
+            self._journal = None
+
+    def _write_journal(self, record):
+        self._journal.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self._journal.flush()
+        if self.durability == 'fsync':
+            os.fsync(self._journal.fileno())
+
+    def _replay_journal(self):
+        """读取日志，返回尚未提交的 (ticket, item) 列表"""
+        if not os.path.exists(self.journal_path):
+            return []
+
+        pending = {}
+        with open(self.journal_path, encoding='utf-8') as journal:
+            for line in journal:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时写了一半的最后一行
+                if 'committed' in record:
+                    for ticket in record['committed']:
+                        pending.pop(ticket, None)
+                else:
+                    pending[record['ticket']] = record['item']
+
+        os.remove(self.journal_path)
+        return list(pending.items())
+
+    def _compact_journal(self):
+        """队列为空时压缩日志，避免无限增长：没有写入失败的成绩时直接截断，
+        否则把失败的成绩写入临时文件后替换日志，替换前崩溃也不会丢失
+        """
+        with self._journal_lock:
+            if not self._queue.empty():
+                return
+            if not self._failed:
+                self._journal.seek(0)
+                self._journal.truncate()
+                return
+
+            temp_path = f'{self.journal_path}.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as journal:
+                for ticket, item in self._failed.items():
+                    journal.write(json.dumps({'ticket': ticket, 'item': item}, ensure_ascii=False) + '\n')
+                journal.flush()
+                os.fsync(journal.fileno())
+            self._journal.close()
+            os.replace(temp_path, self.journal_path)
+            self._journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+
+            # 凑满 batch_size 条或等待 flush_interval 后提交一组
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._commit_batch(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _commit_batch(self, batch):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self._commit([item for _, item in batch])
+                break
+            except Exception:
+                logger.exception('成绩分组写入失败（第 %d 次）', attempt)
+                time.sleep(0.1 * attempt)
+        else:
+            # 保留在日志中，重启时重放
+            logger.error('放弃写入 %d 条成绩', len(batch))
+            if self._journal:
+                with self._journal_lock:
+                    self._failed.update(batch)
+            return
+
+        if self._journal:
+            with self._journal_lock:
+                self._write_journal({'committed': [ticket for ticket, _ in batch]})
+            self._compact_journal()
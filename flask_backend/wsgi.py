@@ -0,0 +1,9 @@
+"""生产环境 WSGI 入口
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+每个 worker 进程各自导入本模块，拥有独立的连接池和进程内状态。
+"""
+from app import create_app
+
+application = create_app()